@@ -0,0 +1,14 @@
+"""
+Solver benchmarks with regression tracking
+
+Run from the CombateNaval directory:
+
+    python -m benchmark                 # run everything, compare to baseline
+    python -m benchmark --save-baseline # also store the results as baseline
+    python -m benchmark -c queens-8 -s backtracking
+
+Results are appended to history.json, and regressions against
+baseline.json are reported, making the command fail. Both files are kept
+in ~/.csp-benchmark, or in the directory given by --output or the
+CSP_BENCHMARK_DIR environment variable.
+"""
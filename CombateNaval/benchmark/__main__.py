@@ -0,0 +1,62 @@
+import json
+import optparse
+import os
+import sys
+
+from benchmark import suite
+
+def main(args=None):
+    parser = optparse.OptionParser(usage="python -m benchmark [options]")
+    parser.add_option("-c", "--cases", action="append", default=[],
+                      help="run only the given case (repeatable)")
+    parser.add_option("-s", "--solvers", action="append", default=[],
+                      help="run only the given solver (repeatable)")
+    parser.add_option("--timeout", type="float", default=60,
+                      help="time limit of each run, in seconds")
+    parser.add_option("--tolerance", type="float", default=0.25,
+                      help="relative increase considered a regression")
+    parser.add_option("--label", help="label stored in the history")
+    parser.add_option("--output", default=suite.OUTPUT,
+                      help="directory of the history and baseline files")
+    parser.add_option("--history",
+                      help="JSON file where results are appended")
+    parser.add_option("--baseline",
+                      help="JSON file with the baseline results")
+    parser.add_option("--save-baseline", action="store_true",
+                      help="store the results as the new baseline")
+    parser.add_option("--list", action="store_true",
+                      help="list the runs and exit")
+    parser.add_option("--case", help=optparse.SUPPRESS_HELP)
+    options, args = parser.parse_args(args)
+
+    if options.case:
+        # Child process running a single case.
+        print json.dumps(suite.runCase(options.case, options.timeout))
+        return 0
+
+    if options.history is None:
+        options.history = os.path.join(options.output, "history.json")
+    if options.baseline is None:
+        options.baseline = os.path.join(options.output, "baseline.json")
+
+    keys = suite.getKeys(options.cases, options.solvers)
+    if options.list:
+        print "\n".join(keys)
+        return 0
+    results = suite.run(keys, options.timeout)
+    suite.record(results, options.history, options.label)
+    baseline = suite.load(options.baseline, {})
+    regressions = suite.compare(results, baseline, options.tolerance)
+    if options.save_baseline:
+        baseline.update(results)
+        suite.save(options.baseline, baseline)
+    if regressions:
+        print
+        print "Regressions:"
+        for regression in regressions:
+            print "  "+regression
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,180 @@
+"""
+Parameterized problem instances used by the benchmarks
+
+Every builder receives the solver to be used and returns a L{Problem}.
+Instances depending on random choices take a seed, so the same
+parameters always build the same problem.
+"""
+import random
+
+from constraint import Problem, AllDifferentConstraint, \
+                       ExactSumConstraint, FunctionConstraint
+
+# Synthetic map using the department names of ProblemaColearMapa/PCM.py.
+# PCM.py itself only links CHOCO and RISARALDA, so the borders below are
+# made up, and don't match the real map of Colombia.
+COLOMBIA = {
+    "CHOCO": ["ANTIOQUIA", "RISARALDA", "VALLE DEL CAUCA"],
+    "ANTIOQUIA": ["CHOCO", "RISARALDA", "CALDAS"],
+    "RISARALDA": ["CHOCO", "ANTIOQUIA", "CALDAS", "TOLIMA", "QUINDIO",
+                  "VALLE DEL CAUCA"],
+    "CALDAS": ["ANTIOQUIA", "RISARALDA", "TOLIMA"],
+    "QUINDIO": ["RISARALDA", "TOLIMA", "VALLE DEL CAUCA"],
+    "TOLIMA": ["CALDAS", "RISARALDA", "QUINDIO", "VALLE DEL CAUCA",
+               "CAUCA"],
+    "VALLE DEL CAUCA": ["CHOCO", "RISARALDA", "QUINDIO", "TOLIMA",
+                        "CAUCA"],
+    "CAUCA": ["VALLE DEL CAUCA", "TOLIMA", "NARINO", "PUTUMAYO"],
+    "NARINO": ["CAUCA", "PUTUMAYO"],
+    "PUTUMAYO": ["NARINO", "CAUCA", "AMAZONAS"],
+    "AMAZONAS": ["PUTUMAYO", "VAUPES"],
+    "VAUPES": ["AMAZONAS"],
+}
+
+SUDOKU = {
+    "easy": "53..7....6..195....98....6.8...6...34..8.3..17...2...6"
+            ".6....28....419..5....8..79",
+    "hard": "8..........36......7..9.2...5...7.......457.....1...3."
+            "..1....68..85...1..9....4..",
+}
+
+def queens(solver, n=8):
+    """
+    Place n queens on an n by n board without attacks
+
+    The same model as probando.py, with the diagonals added.
+    """
+    problem = Problem(solver)
+    columns = range(n)
+    problem.addVariables(columns, range(n))
+    for column1 in columns:
+        for column2 in columns:
+            if column1 < column2:
+                distance = column2-column1
+                problem.addConstraint(lambda row1, row2, distance=distance:
+                                      row1 != row2 and
+                                      abs(row1-row2) != distance,
+                                      (column1, column2))
+    return problem
+
+def battleship(solver, size=6, ships=(3, 2, 2, 1), seed=0):
+    """
+    Find ship cells in a grid given the number of cells in each row and
+    column, as in BattleShip.py and CN.py
+
+    Ships are placed randomly to compute the sums, so the instance is
+    always solvable. As in CN.py, ships may not touch diagonally.
+    """
+    rand = random.Random(seed)
+    grid = [[0]*size for row in range(size)]
+    for length in ships:
+        for attempt in range(1000):
+            horizontal = rand.random() < 0.5
+            if horizontal:
+                row = rand.randrange(size)
+                col = rand.randrange(size-length+1)
+                cells = [(row, col+i) for i in range(length)]
+            else:
+                row = rand.randrange(size-length+1)
+                col = rand.randrange(size)
+                cells = [(row+i, col) for i in range(length)]
+            if all(grid[y][x] == 0 for r, c in cells
+                   for y in range(max(r-1, 0), min(r+2, size))
+                   for x in range(max(c-1, 0), min(c+2, size))):
+                for r, c in cells:
+                    grid[r][c] = 1
+                break
+    problem = Problem(solver)
+    for row in range(size):
+        for col in range(size):
+            problem.addVariable(row*size+col, [0, 1])
+    for row in range(size):
+        problem.addConstraint(ExactSumConstraint(sum(grid[row])),
+                              [row*size+col for col in range(size)])
+    for col in range(size):
+        problem.addConstraint(ExactSumConstraint(sum(grid[row][col]
+                                                     for row in range(size))),
+                              [row*size+col for row in range(size)])
+    apart = FunctionConstraint(lambda a, b: not (a and b))
+    for row in range(size-1):
+        for col in range(size):
+            if col > 0:
+                problem.addConstraint(apart, [row*size+col,
+                                              (row+1)*size+col-1])
+            if col < size-1:
+                problem.addConstraint(apart, [row*size+col,
+                                              (row+1)*size+col+1])
+    return problem
+
+def mapcolouring(solver, regions=None, colours=3, seed=0):
+    """
+    Colour a map so that neighbouring regions differ, as in PCM.py
+
+    Without a number of regions the synthetic map of L{COLOMBIA}, named
+    after the departments of PCM.py, is used. Otherwise a random
+    planar-like map is built by joining random points to their nearest
+    neighbours.
+    """
+    if regions is None:
+        graph = COLOMBIA
+    else:
+        rand = random.Random(seed)
+        points = [(rand.random(), rand.random()) for i in range(regions)]
+        graph = dict((i, set()) for i in range(regions))
+        for i, (x1, y1) in enumerate(points):
+            nearest = sorted(((x2-x1)**2+(y2-y1)**2, j)
+                             for j, (x2, y2) in enumerate(points) if j != i)
+            for distance, j in nearest[:3]:
+                graph[i].add(j)
+                graph[j].add(i)
+    problem = Problem(solver)
+    problem.addVariables(sorted(graph), range(colours))
+    for region in sorted(graph):
+        for neighbour in graph[region]:
+            if region < neighbour:
+                problem.addConstraint(lambda a, b: a != b,
+                                      (region, neighbour))
+    return problem
+
+def sudoku(solver, puzzle="easy"):
+    """
+    Fill a 9 by 9 sudoku grid given as a string of digits and dots
+    """
+    grid = SUDOKU.get(puzzle, puzzle)
+    problem = Problem(solver)
+    for index, char in enumerate(grid):
+        if char == ".":
+            problem.addVariable(index, range(1, 10))
+        else:
+            problem.addVariable(index, [int(char)])
+    for i in range(9):
+        problem.addConstraint(AllDifferentConstraint(),
+                              [i*9+j for j in range(9)])
+        problem.addConstraint(AllDifferentConstraint(),
+                              [j*9+i for j in range(9)])
+        row, col = i//3*3, i%3*3
+        problem.addConstraint(AllDifferentConstraint(),
+                              [(row+j//3)*9+col+j%3 for j in range(9)])
+    return problem
+
+def randombinary(solver, variables=20, values=8, density=0.3,
+                 tightness=0.3, seed=0):
+    """
+    Random binary problem following model B
+
+    Exactly C{density} of the variable pairs are constrained, and each
+    constraint forbids exactly C{tightness} of the value pairs.
+    """
+    rand = random.Random(seed)
+    pairs = [(a, b) for a in range(variables)
+             for b in range(a+1, variables)]
+    pairs = rand.sample(pairs, int(round(density*len(pairs))))
+    combinations = [(a, b) for a in range(values) for b in range(values)]
+    problem = Problem(solver)
+    problem.addVariables(range(variables), range(values))
+    for pair in sorted(pairs):
+        forbidden = set(rand.sample(combinations,
+                                    int(round(tightness*len(combinations)))))
+        problem.addConstraint(lambda a, b, forbidden=forbidden:
+                              (a, b) not in forbidden, pair)
+    return problem
@@ -0,0 +1,218 @@
+"""
+Benchmark cases, their execution and regression tracking
+
+Each case is run with each solver in a fresh interpreter, so the peak
+memory reported by C{getrusage()} belongs to that run alone. Results are
+appended to a JSON history, and compared against a stored baseline.
+"""
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+
+from constraint import BacktrackingSolver, RecursiveBacktrackingSolver, \
+                       MinConflictsSolver, ParallelSolver, BackjumpingSolver, \
+                       RestartingSolver, DecomposingSolver, TreeSolver, \
+                       DomWDegOrdering, LCVOrdering, PartialSolution
+from benchmark import instances
+
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+# Results are kept out of the source tree, in $CSP_BENCHMARK_DIR if set.
+OUTPUT = os.environ.get("CSP_BENCHMARK_DIR") or \
+         os.path.join(os.path.expanduser("~"), ".csp-benchmark")
+HISTORY = os.path.join(OUTPUT, "history.json")
+BASELINE = os.path.join(OUTPUT, "baseline.json")
+
+SEED = 1234
+
+# Name, builder, parameters, and whether the case looks for one or all
+# solutions.
+CASES = [
+    ("queens-8", instances.queens, {"n": 8}, "all"),
+    ("queens-40", instances.queens, {"n": 40}, "one"),
+    ("battleship-5", instances.battleship,
+     {"size": 5, "ships": (3, 2, 1)}, "all"),
+    ("battleship-10", instances.battleship,
+     {"size": 10, "ships": (4, 3, 3, 2, 2, 2, 1, 1, 1, 1)}, "one"),
+    ("colombia", instances.mapcolouring, {}, "all"),
+    ("map-60", instances.mapcolouring, {"regions": 60, "colours": 4},
+     "one"),
+    ("sudoku-easy", instances.sudoku, {"puzzle": "easy"}, "one"),
+    ("sudoku-hard", instances.sudoku, {"puzzle": "hard"}, "one"),
+    ("random-15", instances.randombinary,
+     {"variables": 15, "values": 6, "density": 0.4, "tightness": 0.4},
+     "all"),
+    ("random-40", instances.randombinary,
+     {"variables": 40, "values": 10, "density": 0.2, "tightness": 0.3},
+     "one"),
+]
+
+SOLVERS = [
+    ("backtracking", BacktrackingSolver),
+    ("domwdeg", lambda: BacktrackingSolver(ordering=DomWDegOrdering())),
+    ("lcv", lambda: BacktrackingSolver(valueordering=LCVOrdering())),
+    ("recursive", RecursiveBacktrackingSolver),
+    ("backjumping", BackjumpingSolver),
+    ("restarts", lambda: RestartingSolver(BacktrackingSolver(
+        ordering=DomWDegOrdering()), seed=SEED)),
+    ("minconflicts", lambda: MinConflictsSolver(steps=10000)),
+    ("parallel", lambda: ParallelSolver(workers=2)),
+    ("decomposing", DecomposingSolver),
+    ("tree", TreeSolver),
+]
+
+# Solvers which can't enumerate solutions.
+SINGLE = ["minconflicts", "restarts"]
+
+def getKeys(cases=None, solvers=None):
+    """
+    List the "case/solver" keys to be run
+
+    @param cases: Names of the cases to include (default is all)
+    @param solvers: Names of the solvers to include (default is all)
+    """
+    keys = []
+    for name, builder, parameters, mode in CASES:
+        if cases and name not in cases:
+            continue
+        for solvername, factory in SOLVERS:
+            if solvers and solvername not in solvers:
+                continue
+            if mode == "all" and solvername in SINGLE:
+                continue
+            keys.append("%s/%s" % (name, solvername))
+    return keys
+
+def runCase(key, timeout=60):
+    """
+    Run a single case in the current process
+
+    @param key: Key as returned by L{getKeys}
+    @param timeout: Time limit of the search, in seconds
+    @return: Dictionary with the wall time of the search, the nodes,
+             solutions and peak memory (in kilobytes), and whether the
+             time limit was reached
+    @rtype: dict
+    """
+    name, solvername = key.split("/")
+    builder, parameters, mode = [case[1:] for case in CASES
+                                 if case[0] == name][0]
+    factory = dict(SOLVERS)[solvername]
+    random.seed(SEED)
+    solver = factory()
+    problem = builder(solver, **parameters)
+    start = time.time()
+    if mode == "one":
+        solution = problem.getSolution(timeout=timeout)
+        solutions = int(solution is not None and
+                        not isinstance(solution, PartialSolution))
+    else:
+        solutions = problem.countSolutions(timeout=timeout)
+    elapsed = time.time()-start
+    stats = solver.getStats()
+    return {"time": round(elapsed, 4),
+            "nodes": stats and stats.nodes or 0,
+            "solutions": solutions,
+            "memory": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "limited": bool(stats and stats.limited)}
+
+def run(keys, timeout=60, output=sys.stdout):
+    """
+    Run cases, each in a new interpreter
+
+    @return: Dictionary mapping keys to results, as in L{runCase}, or to
+             None for runs which failed
+    @rtype: dict
+    """
+    results = {}
+    for key in keys:
+        process = subprocess.Popen([sys.executable, "-m", "benchmark",
+                                    "--case", key, "--timeout", str(timeout)],
+                                   cwd=os.path.dirname(DIRECTORY),
+                                   stdout=subprocess.PIPE)
+        data = process.communicate()[0]
+        if process.returncode == 0:
+            results[key] = json.loads(data.splitlines()[-1])
+            output.write("%-32s %9.3fs %10d nodes %8d KB%s\n" %
+                         (key, results[key]["time"], results[key]["nodes"],
+                          results[key]["memory"],
+                          results[key]["limited"] and " (limited)" or ""))
+        else:
+            results[key] = None
+            output.write("%-32s failed\n" % key)
+    return results
+
+def load(path, default):
+    if not os.path.exists(path):
+        return default
+    file = open(path)
+    try:
+        return json.load(file)
+    finally:
+        file.close()
+
+def save(path, data):
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    file = open(path, "w")
+    try:
+        json.dump(data, file, indent=1, sort_keys=True)
+    finally:
+        file.close()
+
+def record(results, path=HISTORY, label=None):
+    """
+    Append results to the JSON history
+    """
+    history = load(path, [])
+    history.append({"date": time.strftime("%Y-%m-%d %H:%M:%S"),
+                    "label": label,
+                    "results": results})
+    save(path, history)
+
+def compare(results, baseline, tolerance=0.25, floor=0.05):
+    """
+    Find regressions against baseline results
+
+    A run regresses when it fails, finds a different number of solutions
+    in a case enumerating them all, hits the time limit when the
+    baseline didn't, or takes more time, nodes or memory than the
+    baseline by more than the tolerance. Times below the floor are
+    considered noise.
+
+    @param tolerance: Relative increase allowed
+    @type  tolerance: float
+    @param floor: Time difference ignored, in seconds
+    @type  floor: float
+    @return: Description of each regression
+    @rtype: list of strings
+    """
+    regressions = []
+    for key in sorted(results):
+        old = baseline.get(key)
+        new = results[key]
+        if old is None:
+            continue
+        if new is None:
+            regressions.append("%s: failed" % key)
+            continue
+        mode = [case[3] for case in CASES if case[0] == key.split("/")[0]]
+        if mode == ["all"] and not new["limited"] and \
+           not old["limited"] and new["solutions"] != old["solutions"]:
+            regressions.append("%s: %d solutions instead of %d" %
+                               (key, new["solutions"], old["solutions"]))
+        if new["limited"] and not old["limited"]:
+            regressions.append("%s: time limit reached" % key)
+        if new["time"] > old["time"]*(1+tolerance) and \
+           new["time"]-old["time"] > floor:
+            regressions.append("%s: time %.3fs, was %.3fs" %
+                               (key, new["time"], old["time"]))
+        for field in ("nodes", "memory"):
+            if new[field] > old[field]*(1+tolerance):
+                regressions.append("%s: %s %d, was %d" %
+                                   (key, field, new[field], old[field]))
+    return regressions
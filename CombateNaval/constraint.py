@@ -26,11 +26,25 @@
 """
 @var Unassigned: Helper object instance representing unassigned values
 
-@sort: Problem, Variable, Domain
+@sort: Problem, CompiledProblem, SolutionCache, Variable, Domain, BitDomain,
+       SolverStats, PartialSolution
 @group Solvers: Solver,
                 BacktrackingSolver,
                 RecursiveBacktrackingSolver,
-                MinConflictsSolver
+                MinConflictsSolver,
+                ParallelSolver,
+                BackjumpingSolver,
+                PortfolioSolver,
+                RestartingSolver,
+                DecomposingSolver,
+                TreeSolver
+@group Orderings: VariableOrdering,
+                  DegreeMRVOrdering,
+                  DomWDegOrdering,
+                  ValueOrdering,
+                  LCVOrdering,
+                  RandomValueOrdering,
+                  PhaseSavingOrdering
 @group Constraints: Constraint,
                     FunctionConstraint,
                     AllDifferentConstraint,
@@ -41,31 +55,70 @@
                     InSetConstraint,
                     NotInSetConstraint,
                     SomeInSetConstraint,
-                    SomeNotInSetConstraint
+                    SomeNotInSetConstraint,
+                    TableConstraint
 """
+import os
+import sys
 import random
 import copy
-
-__all__ = ["Problem", "Variable", "Domain", "Unassigned",
+import hashlib
+import marshal
+import types
+import dis
+import __builtin__
+import heapq
+import itertools
+import time
+import traceback
+import multiprocessing
+from Queue import Empty
+from array import array
+from collections import deque, OrderedDict
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+__all__ = ["Problem", "CompiledProblem", "SolutionCache", "Variable",
+           "Domain", "BitDomain", "Unassigned", "SolverStats",
+           "PartialSolution",
            "Solver", "BacktrackingSolver", "RecursiveBacktrackingSolver",
-           "MinConflictsSolver", "Constraint", "FunctionConstraint",
+           "MinConflictsSolver", "ParallelSolver", "BackjumpingSolver",
+           "PortfolioSolver", "RestartingSolver", "DecomposingSolver",
+           "TreeSolver", "VariableOrdering", "DegreeMRVOrdering",
+           "DomWDegOrdering", "ValueOrdering", "LCVOrdering",
+           "RandomValueOrdering", "PhaseSavingOrdering", "Constraint",
+           "FunctionConstraint",
            "AllDifferentConstraint", "AllEqualConstraint", "MaxSumConstraint",
            "ExactSumConstraint", "MinSumConstraint", "InSetConstraint",
            "NotInSetConstraint", "SomeInSetConstraint",
-           "SomeNotInSetConstraint"]
+           "SomeNotInSetConstraint", "TableConstraint"]
 
 class Problem(object):
     """
     Class used to define a problem and retrieve solutions
     """
 
-    def __init__(self, solver=None):
+    def __init__(self, solver=None, arcconsistency=False, cache=None):
         """
         @param solver: Problem solver used to find solutions
                        (default is L{BacktrackingSolver})
         @type solver:  instance of a L{Solver} subclass
+        @param arcconsistency: Whether arc consistency should be enforced
+                               on the domains before the solver starts
+                               (default is false)
+        @type arcconsistency:  bool
+        @param cache: Cache where solutions found by L{getSolution} and
+                      L{getSolutions} are kept and looked up. Problems with
+                      constraints lacking a fingerprint aren't cached.
+                      (default is no cache)
+        @type cache:  instance of L{SolutionCache}
         """
         self._solver = solver or BacktrackingSolver()
+        self._arcconsistency = arcconsistency
+        self._cache = cache
         self._constraints = []
         self._variables = {}
 
@@ -127,18 +180,21 @@ class Problem(object):
         >>> problem.getSolution() in ({'a': 1}, {'a': 2})
         True
 
+        Lists and tuples are stored as a L{Domain}. A L{BitDomain} must be
+        given explicitly to have the values kept as a bitmask.
+
         @param variable: Object representing a problem variable
         @type  variable: hashable object
         @param domain: Set of items defining the possible values that
                        the given variable may assume
-        @type  domain: list, tuple, or instance of C{Domain}
+        @type  domain: list, tuple, or instance of C{Domain} or C{BitDomain}
         """
         if variable in self._variables:
             raise ValueError, "Tried to insert duplicated variable %s" % \
                               repr(variable)
         if type(domain) in (list, tuple):
             domain = Domain(domain)
-        elif isinstance(domain, Domain):
+        elif isinstance(domain, (Domain, BitDomain)):
             domain = copy.copy(domain)
         else:
             raise TypeError, "Domains must be instances of subclasses of "\
@@ -199,7 +255,7 @@ class Problem(object):
                                   "subclasses of the Constraint class"
         self._constraints.append((constraint, variables))
 
-    def getSolution(self):
+    def getSolution(self, timeout=None, maxnodes=None):
         """
         Find and return a solution to the problem
 
@@ -212,15 +268,51 @@ class Problem(object):
         >>> problem.getSolution()
         {'a': 42}
 
+        Searches may be bounded in time and nodes. If a limit is reached
+        before finding a solution, None is returned, except for local
+        search solvers which return their best assignment as a
+        L{PartialSolution}:
+
+        >>> problem = Problem(MinConflictsSolver())
+        >>> problem.addVariables(["a", "b", "c"], [1, 2])
+        >>> problem.addConstraint(AllDifferentConstraint())
+        >>> solution = problem.getSolution(maxnodes=50)
+        >>> solution.conflicts
+        1
+        >>> problem.getSolver().getStats().limited
+        True
+
+        @param timeout: Maximum time spent searching, in seconds (default
+                        is no limit)
+        @type  timeout: number
+        @param maxnodes: Maximum number of search nodes (default is no
+                         limit)
+        @type  maxnodes: int
         @return: Solution for the problem
         @rtype: dictionary mapping variables to values
         """
+        cachekey = self._getCacheKey()
+        if cachekey is not None:
+            for suffix in ("-one", "-all"):
+                solutions = self._getCached(cachekey, suffix)
+                if solutions is not None:
+                    return (solutions or [None])[0]
         domains, constraints, vconstraints = self._getArgs()
         if not domains:
-            return None
-        return self._solver.getSolution(domains, constraints, vconstraints)
-
-    def getSolutions(self):
+            solution = None
+        else:
+            self._solver.setLimits(timeout, maxnodes)
+            solution = self._solver.getSolution(domains, constraints,
+                                                vconstraints)
+            if self._solver.getStats() is not None and \
+               self._solver.getStats().limited:
+                return solution
+        if cachekey is not None:
+            self._putCached(cachekey, "-one",
+                            solution is not None and [solution] or [])
+        return solution
+
+    def getSolutions(self, limit=None, timeout=None, maxnodes=None):
         """
         Find and return all solutions to the problem
 
@@ -233,15 +325,43 @@ class Problem(object):
         >>> problem.getSolutions()
         [{'a': 42}]
 
-        @return: All solutions for the problem
+        @param limit: Maximum number of solutions returned (default is
+                      no limit)
+        @type  limit: int
+        @param timeout: Maximum time spent searching, in seconds (default
+                        is no limit)
+        @type  timeout: number
+        @param maxnodes: Maximum number of search nodes (default is no
+                         limit)
+        @type  maxnodes: int
+        @return: All solutions for the problem, or the ones found before
+                 reaching a time or node limit
         @rtype: list of dictionaries mapping variables to values
         """
+        cachekey = limit is None and self._getCacheKey() or None
+        if cachekey is not None:
+            solutions = self._getCached(cachekey, "-all")
+            if solutions is not None:
+                return solutions
         domains, constraints, vconstraints = self._getArgs()
         if not domains:
-            return []
-        return self._solver.getSolutions(domains, constraints, vconstraints)
+            solutions = []
+        else:
+            self._solver.setLimits(timeout, maxnodes)
+            if limit is not None:
+                return list(limitIter(self._solver.getSolutionIter(
+                                          domains, constraints, vconstraints),
+                                      limit))
+            solutions = self._solver.getSolutions(domains, constraints,
+                                                  vconstraints)
+            if self._solver.getStats() is not None and \
+               self._solver.getStats().limited:
+                return solutions
+        if cachekey is not None:
+            self._putCached(cachekey, "-all", solutions)
+        return solutions
 
-    def getSolutionIter(self):
+    def getSolutionIter(self, limit=None, timeout=None, maxnodes=None):
         """
         Return an iterator to the solutions of the problem
 
@@ -258,12 +378,205 @@ class Problem(object):
         Traceback (most recent call last):
           File "<stdin>", line 1, in ?
         StopIteration
+
+        @param limit: Maximum number of solutions iterated (default is
+                      no limit)
+        @type  limit: int
+        @param timeout: Maximum time spent searching, in seconds (default
+                        is no limit)
+        @type  timeout: number
+        @param maxnodes: Maximum number of search nodes (default is no
+                         limit)
+        @type  maxnodes: int
         """
         domains, constraints, vconstraints = self._getArgs()
         if not domains:
             return iter(())
-        return self._solver.getSolutionIter(domains, constraints,
-                                            vconstraints)
+        self._solver.setLimits(timeout, maxnodes)
+        iterator = self._solver.getSolutionIter(domains, constraints,
+                                                vconstraints)
+        if limit is not None:
+            iterator = limitIter(iterator, limit)
+        return iterator
+
+    def countSolutions(self, limit=None, callback=None, timeout=None,
+                       maxnodes=None):
+        """
+        Count the solutions to the problem
+
+        Solutions are counted without building a dictionary for each of
+        them, when the solver supports it.
+
+        Example:
+
+        >>> problem = Problem()
+        >>> problem.countSolutions()
+        0
+        >>> problem.addVariables(["a", "b"], [1, 2, 3])
+        >>> problem.addConstraint(lambda a, b: b > a, ["a", "b"])
+        >>> problem.countSolutions()
+        3
+        >>> problem.countSolutions(limit=2)
+        2
+        >>> found = []
+        >>> problem.countSolutions(callback=lambda x: found.append(x["b"]))
+        3
+        >>> sorted(found)
+        [2, 3, 3]
+
+        @param limit: Maximum number of solutions counted (default is
+                      no limit)
+        @type  limit: int
+        @param callback: Function called with each solution. The same
+                         dictionary may be passed on every call, so it
+                         must be copied if it's going to be kept.
+        @type  callback: callable object
+        @param timeout: Maximum time spent searching, in seconds (default
+                        is no limit)
+        @type  timeout: number
+        @param maxnodes: Maximum number of search nodes (default is no
+                         limit)
+        @type  maxnodes: int
+        @return: Number of solutions, or the ones found before reaching
+                 a time or node limit
+        @rtype: int
+        """
+        domains, constraints, vconstraints = self._getArgs()
+        if not domains:
+            return 0
+        self._solver.setLimits(timeout, maxnodes)
+        return self._solver.countSolutions(domains, constraints,
+                                           vconstraints, limit, callback)
+
+    def getSolutionsArray(self, variables=None, limit=None, output=None,
+                          timeout=None, maxnodes=None):
+        """
+        Find all solutions and return them as a NumPy array
+
+        Each row of the array is a solution and each column a variable,
+        holding the position of the variable's value in a lookup table,
+        so no dictionary is kept for each solution. Requires NumPy.
+
+        Example:
+
+        >>> problem = Problem()
+        >>> problem.addVariables(["a", "b"], [1, 2, 3])
+        >>> problem.addConstraint(lambda a, b: b > a, ["a", "b"])
+        >>> variables, values, indices = problem.getSolutionsArray()
+        >>> variables, values
+        (['a', 'b'], [[1, 2, 3], [1, 2, 3]])
+        >>> sorted(indices.tolist())
+        [[0, 1], [0, 2], [1, 2]]
+
+        @param variables: Variables of each column, in order (default is
+                          every variable, sorted)
+        @type  variables: sequence of hashable objects
+        @param limit: Maximum number of solutions returned (default is
+                      no limit)
+        @type  limit: int
+        @param output: Path of a file where the array is memory-mapped,
+                       for enumerations which don't fit in memory. It's
+                       overwritten, and holds the raw rows when done.
+                       (default is to keep the array in memory)
+        @type  output: string
+        @param timeout: Maximum time spent searching, in seconds (default
+                        is no limit)
+        @type  timeout: number
+        @param maxnodes: Maximum number of search nodes (default is no
+                         limit)
+        @type  maxnodes: int
+        @return: Tuple with the list of variables, the lookup table of
+                 values of each variable, and the array of positions in
+                 those tables
+        @rtype: tuple
+        """
+        if variables is None:
+            variables = sorted(self._variables)
+        else:
+            variables = list(variables)
+        domains, constraints, vconstraints = self._getArgs()
+        if domains:
+            values = [domains[variable][:] for variable in variables]
+        else:
+            values = [list(self._variables[variable])
+                      for variable in variables]
+        self._solver.setLimits(timeout, maxnodes)
+        indices = fillSolutionsArray(self._solver, domains, constraints,
+                                     vconstraints, variables, values, limit,
+                                     output)
+        return variables, values, indices
+
+    def compile(self):
+        """
+        Build a compiled model of the problem for repeated solving
+
+        The compiled model is independent from the problem, so later
+        changes to the problem don't affect it.
+
+        Example:
+
+        >>> problem = Problem()
+        >>> problem.addVariables(["a", "b"], [1, 2, 3])
+        >>> problem.addConstraint(lambda a, b: b > a, ["a", "b"])
+        >>> model = problem.compile()
+        >>> model.countSolutions()
+        3
+
+        @return: Compiled model of the problem
+        @rtype: L{CompiledProblem}
+        """
+        return CompiledProblem(self)
+
+    def _getCacheKey(self):
+        # Variables are sorted by their representation, and solutions are
+        # stored as the position of each value in the original domains.
+        if self._cache is None or not self._variables:
+            return None
+        parts = []
+        for constraint, variables in self._constraints:
+            fingerprint = constraint.fingerprint()
+            if fingerprint is None:
+                return None
+            parts.append("%s %r" % (fingerprint,
+                                    variables and list(variables)))
+        parts.sort()
+        variables = sorted(self._variables, key=repr)
+        values = []
+        for variable in variables:
+            domain = self._variables[variable]
+            domain.resetState()
+            values.append(list(domain))
+            parts.append("%r %r" % (variable, values[-1]))
+        if len(set(map(repr, variables))) != len(variables):
+            return None
+        try:
+            positions = [dict((value, index)
+                              for index, value in enumerate(domain))
+                         for domain in values]
+        except TypeError:
+            return None
+        key = hashlib.sha1("\n".join(parts)).hexdigest()
+        return key, variables, values, positions
+
+    def _getCached(self, cachekey, suffix):
+        key, variables, values, positions = cachekey
+        rows = self._cache.get(key+suffix, len(variables))
+        if rows is None:
+            return None
+        return [dict([(variable, domain[index])
+                      for variable, domain, index
+                      in zip(variables, values, row)])
+                for row in rows]
+
+    def _putCached(self, cachekey, suffix, solutions):
+        key, variables, values, positions = cachekey
+        try:
+            rows = [[position[solution[variable]]
+                     for variable, position in zip(variables, positions)]
+                    for solution in solutions]
+        except (KeyError, TypeError):
+            return
+        self._cache.put(key+suffix, rows)
 
     def _getArgs(self):
         domains = self._variables.copy()
@@ -279,6 +592,8 @@ class Problem(object):
         for constraint, variables in constraints:
             for variable in variables:
                 vconstraints[variable].append((constraint, variables))
+        for domain in domains.values():
+            domain.resetState()
         for constraint, variables in constraints[:]:
             constraint.preProcess(variables, domains,
                                   constraints, vconstraints)
@@ -286,9 +601,519 @@ class Problem(object):
             domain.resetState()
             if not domain:
                 return None, None, None
-        #doArc8(getArcs(domains, constraints), domains, {})
+        if self._arcconsistency:
+            if not doArcConsistency(domains, constraints):
+                return None, None, None
         return domains, constraints, vconstraints
 
+class SolutionCache(object):
+    """
+    Disk-backed cache of problem solutions
+
+    Solutions are kept in a directory with one file per entry. Each
+    solution is encoded as the position of every value in its variable's
+    domain, written as a compact machine-native array. Entries are touched
+    whenever they're used, and the least recently used ones are removed
+    once there are more than the given number of entries.
+
+    Example:
+
+    >>> import shutil, tempfile
+    >>> directory = tempfile.mkdtemp()
+    >>> def build():
+    ...     problem = Problem(cache=SolutionCache(directory))
+    ...     problem.addVariables(["a", "b"], [1, 2, 3])
+    ...     problem.addConstraint(lambda a, b: b > a, ["a", "b"])
+    ...     return problem
+    >>> len(build().getSolutions())
+    3
+    >>> problem = build()
+    >>> sorted(sorted(x.items()) for x in problem.getSolutions())
+    [[('a', 1), ('b', 2)], [('a', 1), ('b', 3)], [('a', 2), ('b', 3)]]
+    >>> problem.getSolver().getStats() is None
+    True
+
+    Constraints depending on more than their code, such as bound methods
+    or functions reading globals, aren't cached unless given a key:
+
+    >>> class Clue(object):
+    ...     def __init__(self, total):
+    ...         self.total = total
+    ...     def check(self, a, b):
+    ...         return a+b == self.total
+    >>> def build(total, key=None):
+    ...     problem = Problem(cache=SolutionCache(directory))
+    ...     problem.addVariables(["a", "b"], [1, 2, 3])
+    ...     problem.addConstraint(FunctionConstraint(Clue(total).check,
+    ...                                              key=key), ["a", "b"])
+    ...     return problem
+    >>> len(build(3).getSolutions()), len(build(4).getSolutions())
+    (2, 3)
+    >>> build(3)._getCacheKey() is None
+    True
+    >>> build(3, "sum 3")._getCacheKey() is None
+    False
+    >>> FunctionConstraint(lambda a: a in Clue.__dict__).fingerprint()
+    >>> FunctionConstraint(lambda a: abs(a) > 1).fingerprint() is None
+    False
+    >>> shutil.rmtree(directory)
+    """#"""
+
+    def __init__(self, directory, maxentries=1000):
+        """
+        @param directory: Directory where entries are kept. It's created
+                          if it doesn't exist.
+        @type  directory: string
+        @param maxentries: Maximum number of entries kept (default is 1000)
+        @type  maxentries: int
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._directory = directory
+        self._maxentries = maxentries
+
+    def get(self, key, size):
+        """
+        Look up an entry
+
+        @param key: Entry key
+        @type  key: string
+        @param size: Number of values in each row
+        @type  size: int
+        @return: Stored rows of value positions, or None if missing
+        @rtype: list of sequences of ints
+        """
+        path = os.path.join(self._directory, key)
+        try:
+            file = open(path, "rb")
+            try:
+                data = file.read()
+            finally:
+                file.close()
+            os.utime(path, None)
+        except (IOError, OSError):
+            return None
+        if not data or data[0] not in "BHI":
+            return None
+        positions = array(data[0])
+        try:
+            positions.fromstring(data[1:])
+        except ValueError:
+            return None
+        if len(positions) % size:
+            return None
+        return [positions[index:index+size]
+                for index in xrange(0, len(positions), size)]
+
+    def put(self, key, rows):
+        """
+        Store an entry, evicting the least recently used ones if needed
+
+        @param key: Entry key
+        @type  key: string
+        @param rows: Rows of value positions
+        @type  rows: sequence of sequences of ints
+        """
+        largest = max([max(row) for row in rows if row] or [0])
+        for typecode in "BHI":
+            if largest < 1 << 8*array(typecode).itemsize:
+                break
+        positions = array(typecode)
+        for row in rows:
+            positions.extend(row)
+        path = os.path.join(self._directory, key)
+        temporary = "%s.%d.tmp" % (path, os.getpid())
+        try:
+            file = open(temporary, "wb")
+            try:
+                file.write(typecode)
+                file.write(positions.tostring())
+            finally:
+                file.close()
+            os.rename(temporary, path)
+        except (IOError, OSError):
+            return
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used entries above the size limit
+        """
+        entries = []
+        for name in os.listdir(self._directory):
+            if not name.endswith(".tmp"):
+                path = os.path.join(self._directory, name)
+                try:
+                    entries.append((os.path.getmtime(path), path))
+                except OSError:
+                    pass
+        if len(entries) > self._maxentries:
+            entries.sort()
+            for mtime, path in entries[:len(entries)-self._maxentries]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+class CompiledProblem(object):
+    """
+    Reusable model of a problem, ready to be solved many times
+
+    Variables are numbered, and constraints are preprocessed once when
+    the model is built rather than on every search. Constraints may be
+    added and removed, and variables fixed to a value, without
+    rebuilding the whole model. Adding a constraint or fixing a variable
+    never requires preprocessing again the constraints already in the
+    model. Removing a constraint restores the original domains of the
+    variables connected to it, and preprocesses again the constraints on
+    those variables. Solutions are reported with the original variables.
+
+    Example:
+
+    >>> problem = Problem()
+    >>> problem.addVariables(["a", "b", "c"], [1, 2, 3])
+    >>> problem.addConstraint(AllDifferentConstraint())
+    >>> model = problem.compile()
+    >>> model.countSolutions()
+    6
+    >>> model.fix("a", 1)
+    >>> sorted(sorted(x.items()) for x in model.getSolutions())
+    [[('a', 1), ('b', 2), ('c', 3)], [('a', 1), ('b', 3), ('c', 2)]]
+    >>> constraint = InSetConstraint([3])
+    >>> model.addConstraint(constraint, ["b"])
+    >>> model.getSolution() == {'a': 1, 'b': 3, 'c': 2}
+    True
+    >>> model.removeConstraint(constraint)
+    >>> model.unfix("a")
+    >>> model.countSolutions()
+    6
+
+    The model never changes the problem it was compiled from:
+
+    >>> problem = Problem()
+    >>> problem.addVariables(["a", "b"], Domain(range(10)))
+    >>> problem.addConstraint(lambda a, b: a+b == 8, ["a", "b"])
+    >>> model = problem.compile()
+    >>> model.fix("a", 3)
+    >>> model.countSolutions(), problem.countSolutions()
+    (1, 9)
+    >>> model.unfix("a")
+    >>> model.countSolutions(), problem.countSolutions()
+    (9, 9)
+    >>> problem._variables["a"]
+    [0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
+    """#"""
+
+    def __init__(self, problem):
+        """
+        @param problem: Problem to be compiled. Its solver and arc
+                        consistency setting are used by the model.
+        @type  problem: L{Problem}
+        """
+        self._solver = problem._solver
+        self._arcconsistency = problem._arcconsistency
+        self._names = problem._variables.keys()
+        self._index = dict((name, index)
+                           for index, name in enumerate(self._names))
+        self._original = {}
+        self._domains = {}
+        for index, name in enumerate(self._names):
+            domain = copy.copy(problem._variables[name])
+            domain.resetState()
+            self._original[index] = domain
+            self._domains[index] = copy.copy(domain)
+        self._entries = []
+        self._constraints = []
+        self._vconstraints = dict((index, []) for index in self._domains)
+        self._fixed = {}
+        for constraint, variables in problem._constraints:
+            self._entries.append((constraint, self._indices(variables)))
+        self._preProcess(self._entries)
+
+    def getSolver(self):
+        """
+        Obtain the problem solver used by the model
+
+        @return: Solver currently in use
+        @rtype: instance of a L{Solver} subclass
+        """
+        return self._solver
+
+    def setSolver(self, solver):
+        """
+        Change the problem solver used by the model
+
+        @param solver: New problem solver
+        @type  solver: instance of a L{Solver} subclass
+        """
+        self._solver = solver
+
+    def addConstraint(self, constraint, variables=None):
+        """
+        Add a constraint to the model
+
+        Only the new constraint is preprocessed.
+
+        @param constraint: Constraint to be included in the model
+        @type  constraint: instance a L{Constraint} subclass or a
+                           function to be wrapped by L{FunctionConstraint}
+        @param variables: Variables affected by the constraint (default to
+                          all variables)
+        @type  variables: set or sequence of variables
+        """
+        if not isinstance(constraint, Constraint):
+            if callable(constraint):
+                constraint = FunctionConstraint(constraint)
+            else:
+                raise ValueError, "Constraints must be instances of "\
+                                  "subclasses of the Constraint class"
+        entry = (constraint, self._indices(variables))
+        self._entries.append(entry)
+        self._preProcess([entry])
+
+    def removeConstraint(self, constraint):
+        """
+        Remove a constraint from the model
+
+        @param constraint: Constraint previously included in the problem
+                           or the model. Every use of it is removed.
+        @type  constraint: instance a L{Constraint} subclass
+        """
+        removed = [entry for entry in self._entries
+                   if entry[0] is constraint]
+        if not removed:
+            raise ValueError, "Constraint %r is not in the model" % \
+                              constraint
+        self._entries = [entry for entry in self._entries
+                         if entry[0] is not constraint]
+        # Values may have been pruned anywhere in the part of the
+        # constraint graph connected to the removed constraint.
+        affected = set()
+        pending = []
+        for entry in removed:
+            pending.extend(entry[1])
+        neighbours = {}
+        for entry in self._entries:
+            for variable in entry[1]:
+                neighbours.setdefault(variable, []).append(entry)
+        while pending:
+            variable = pending.pop()
+            if variable not in affected:
+                affected.add(variable)
+                for entry in neighbours.get(variable, ()):
+                    pending.extend(entry[1])
+        rerun = [entry for entry in self._entries
+                 if affected.intersection(entry[1])]
+        for constraint, variables in removed+rerun:
+            if (constraint, variables) in self._constraints:
+                self._constraints.remove((constraint, variables))
+                for variable in variables:
+                    self._vconstraints[variable].remove((constraint,
+                                                         variables))
+        for variable in affected:
+            self._domains[variable] = copy.copy(self._original[variable])
+        self._preProcess(rerun)
+
+    def fix(self, variable, value):
+        """
+        Restrict a variable to a single value in the following searches
+
+        @param variable: Variable of the compiled problem
+        @type  variable: hashable object
+        @param value: Value the variable must take
+        """
+        index = self._index[variable]
+        if value not in self._original[index]:
+            raise ValueError, "Value %r is not in the domain of %r" % \
+                              (value, variable)
+        self._fixed[index] = value
+
+    def unfix(self, variable):
+        """
+        Undo a previous L{fix} of a variable
+
+        @param variable: Variable of the compiled problem
+        @type  variable: hashable object
+        """
+        del self._fixed[self._index[variable]]
+
+    def getSolution(self, timeout=None, maxnodes=None):
+        """
+        Find and return a solution to the model
+
+        @param timeout: Maximum time spent searching, in seconds
+        @type  timeout: number
+        @param maxnodes: Maximum number of search nodes
+        @type  maxnodes: int
+        @return: Solution for the problem
+        @rtype: dictionary mapping variables to values
+        """
+        domains, constraints, vconstraints = self._getArgs()
+        if not domains:
+            return None
+        self._solver.setLimits(timeout, maxnodes)
+        solution = self._solver.getSolution(domains, constraints,
+                                            vconstraints)
+        if solution is None:
+            return None
+        return self._translate(solution)
+
+    def getSolutions(self, limit=None, timeout=None, maxnodes=None):
+        """
+        Find and return all solutions to the model
+
+        @param limit: Maximum number of solutions returned (default is
+                      no limit)
+        @type  limit: int
+        @param timeout: Maximum time spent searching, in seconds
+        @type  timeout: number
+        @param maxnodes: Maximum number of search nodes
+        @type  maxnodes: int
+        @return: All solutions for the problem
+        @rtype: list of dictionaries mapping variables to values
+        """
+        if limit is not None:
+            return list(self.getSolutionIter(limit, timeout, maxnodes))
+        domains, constraints, vconstraints = self._getArgs()
+        if not domains:
+            return []
+        self._solver.setLimits(timeout, maxnodes)
+        return map(self._translate,
+                   self._solver.getSolutions(domains, constraints,
+                                             vconstraints))
+
+    def getSolutionIter(self, limit=None, timeout=None, maxnodes=None):
+        """
+        Return an iterator to the solutions of the model
+
+        @param limit: Maximum number of solutions iterated (default is
+                      no limit)
+        @type  limit: int
+        @param timeout: Maximum time spent searching, in seconds
+        @type  timeout: number
+        @param maxnodes: Maximum number of search nodes
+        @type  maxnodes: int
+        """
+        domains, constraints, vconstraints = self._getArgs()
+        if not domains:
+            return iter(())
+        self._solver.setLimits(timeout, maxnodes)
+        iterator = self._solver.getSolutionIter(domains, constraints,
+                                                vconstraints)
+        if limit is not None:
+            iterator = limitIter(iterator, limit)
+        return self._translateIter(iterator)
+
+    def countSolutions(self, limit=None, callback=None, timeout=None,
+                       maxnodes=None):
+        """
+        Count the solutions to the model
+
+        @param limit: Maximum number of solutions counted (default is
+                      no limit)
+        @type  limit: int
+        @param callback: Function called with each solution
+        @type  callback: callable object
+        @param timeout: Maximum time spent searching, in seconds
+        @type  timeout: number
+        @param maxnodes: Maximum number of search nodes
+        @type  maxnodes: int
+        @return: Number of solutions
+        @rtype: int
+        """
+        domains, constraints, vconstraints = self._getArgs()
+        if not domains:
+            return 0
+        self._solver.setLimits(timeout, maxnodes)
+        if callback is not None:
+            translate = self._translate
+            callback = lambda solution, callback=callback: \
+                       callback(translate(solution))
+        return self._solver.countSolutions(domains, constraints,
+                                           vconstraints, limit, callback)
+
+    def getSolutionsArray(self, variables=None, limit=None, output=None,
+                          timeout=None, maxnodes=None):
+        """
+        Find all solutions to the model and return them as a NumPy array
+
+        @see: L{Problem.getSolutionsArray}
+        """
+        if variables is None:
+            variables = sorted(self._names)
+        else:
+            variables = list(variables)
+        columns = variables and self._indices(variables) or []
+        domains, constraints, vconstraints = self._getArgs()
+        if domains:
+            values = [domains[column][:] for column in columns]
+        else:
+            values = [list(self._original[column]) for column in columns]
+        self._solver.setLimits(timeout, maxnodes)
+        indices = fillSolutionsArray(self._solver, domains, constraints,
+                                     vconstraints, columns, values, limit,
+                                     output)
+        return variables, values, indices
+
+    def _indices(self, variables):
+        if not variables:
+            return range(len(self._names))
+        index = self._index
+        return [index[variable] for variable in variables]
+
+    def _preProcess(self, entries):
+        domains = self._domains
+        constraints = self._constraints
+        vconstraints = self._vconstraints
+        for domain in domains.values():
+            domain.resetState()
+        for constraint, variables in entries:
+            constraints.append((constraint, variables))
+            for variable in variables:
+                vconstraints[variable].append((constraint, variables))
+        for constraint, variables in entries:
+            constraint.preProcess(variables, domains,
+                                  constraints, vconstraints)
+
+    def _translate(self, solution):
+        names = self._names
+        translated = dict([(names[index], value)
+                           for index, value in solution.iteritems()])
+        if isinstance(solution, PartialSolution):
+            translated = PartialSolution(translated)
+            translated.conflicts = solution.conflicts
+        return translated
+
+    def _translateIter(self, iterator):
+        translate = self._translate
+        try:
+            for solution in iterator:
+                yield translate(solution)
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    def _getArgs(self):
+        domains = self._domains
+        if not domains:
+            return None, None, None
+        for domain in domains.values():
+            domain.resetState()
+            if not domain:
+                return None, None, None
+        for variable, value in self._fixed.iteritems():
+            domain = domains[variable]
+            if value not in domain:
+                return None, None, None
+            for other in domain[:]:
+                if other != value:
+                    domain.hideValue(other)
+        if self._arcconsistency:
+            if not doArcConsistency(domains, self._constraints):
+                return None, None, None
+        return domains, self._constraints, self._vconstraints
+
 # ----------------------------------------------------------------------
 # Solvers
 # ----------------------------------------------------------------------
@@ -357,45 +1182,615 @@ def doArc8(arcs, domains, assignments):
                 return False
     return True
 
-class Solver(object):
+def limitIter(iterator, limit):
     """
-    Abstract base class for solvers
+    Yield at most the given number of items from an iterator
 
-    @sort: getSolution, getSolutions, getSolutionIter
+    The iterator is closed afterwards when it supports it, so solvers
+    may release their resources without waiting for it to be collected.
     """
+    try:
+        if limit > 0:
+            for count, item in enumerate(iterator):
+                yield item
+                if count+1 >= limit:
+                    break
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            close()
 
-    def getSolution(self, domains, constraints, vconstraints):
-        """
-        Return one solution for the given problem
+def fillSolutionsArray(solver, domains, constraints, vconstraints, columns,
+                       values, limit=None, output=None, batch=1024):
+    """
+    Store the solutions found by a solver in a NumPy array
+
+    Every row of the array is a solution, and every column holds the
+    position of the value of a variable in its lookup table. The
+    smallest unsigned integer type able to index every table is used.
+    The array starts with room for a batch of solutions, and doubles
+    its size whenever it's full. Rows are copied into it a batch at a
+    time, and the array is trimmed to the solutions found at the end.
+
+    @param domains: Dictionary mapping variables to their domains, or
+                    None if the problem has no solutions
+    @type  domains: dict
+    @param constraints: List of pairs of (constraint, variables)
+    @type  constraints: list
+    @param vconstraints: Dictionary mapping variables to a list of
+                         constraints affecting the given variables.
+    @type  vconstraints: dict
+    @param columns: Variables stored in each column, in order
+    @type  columns: sequence
+    @param values: Lookup table of values for each column
+    @type  values: list of lists
+    @param limit: Maximum number of solutions stored, or None
+    @type  limit: int
+    @param output: Path of a file where the array is memory-mapped,
+                   or None to keep it in memory. The file is overwritten,
+                   and holds the raw rows when done.
+    @type  output: string
+    @param batch: Number of solutions copied at once
+    @type  batch: int
+    @return: Array of value positions
+    @rtype: C{numpy.ndarray} or C{numpy.memmap}
+    """
+    if numpy is None:
+        raise ImportError, "NumPy is required to build solution arrays"
+    largest = max([len(table) for table in values] or [0])
+    for dtype in (numpy.uint8, numpy.uint16, numpy.uint32, numpy.uint64):
+        if largest <= numpy.iinfo(dtype).max+1:
+            break
+    width = len(columns)
+    if output is not None and not width:
+        open(output, "wb").close()
+        output = None
+    capacity = batch
+    if limit is not None:
+        capacity = max(min(capacity, limit), 1)
+    if output is None:
+        indices = numpy.empty((capacity, width), dtype)
+    else:
+        indices = numpy.memmap(output, dtype, "w+", shape=(capacity, width))
+    positions = []
+    for table in values:
+        try:
+            positions.append(dict((value, index) for index, value
+                                  in enumerate(table)).__getitem__)
+        except TypeError:
+            positions.append(table.index)
+    columns = zip(positions, columns)
+    count = 0
+    if domains:
+        iterator = solver.getAssignmentIter(domains, constraints,
+                                            vconstraints)
+        if limit is not None:
+            iterator = limitIter(iterator, limit)
+        rows = []
+        for assignments in itertools.chain(iterator, [None]):
+            if assignments is not None:
+                rows.append([position(assignments[column])
+                             for position, column in columns])
+                if len(rows) < batch:
+                    continue
+            elif not rows:
+                break
+            if count+len(rows) > capacity:
+                capacity = max(count+len(rows), capacity*2)
+                indices = resizeSolutionsArray(indices, capacity, output)
+            indices[count:count+len(rows)] = rows
+            count += len(rows)
+            del rows[:]
+    return resizeSolutionsArray(indices, count, output)
+
+def resizeSolutionsArray(indices, rows, output=None):
+    """
+    Change the number of rows of an array built by L{fillSolutionsArray}
 
-        @param domains: Dictionary mapping variables to their domains
-        @type  domains: dict
-        @param constraints: List of pairs of (constraint, variables)
-        @type  constraints: list
-        @param vconstraints: Dictionary mapping variables to a list of
-                             constraints affecting the given variables.
-        @type  vconstraints: dict
-        """
-        raise NotImplementedError, \
-              "%s is an abstract class" % self.__class__.__name__
+    @param output: Path of the file where the array is memory-mapped, if
+                   any. The file is grown or truncated as needed.
+    @type  output: string
+    @return: The resized array, which may be a new object
+    @rtype: C{numpy.ndarray} or C{numpy.memmap}
+    """
+    shape = (rows, indices.shape[1])
+    if output is None:
+        indices.resize(shape, refcheck=False)
+        return indices
+    dtype = indices.dtype
+    indices.flush()
+    del indices
+    if not rows or not shape[1]:
+        file = open(output, "r+b")
+        try:
+            file.truncate(0)
+        finally:
+            file.close()
+        return numpy.empty(shape, dtype)
+    size = rows*shape[1]*dtype.itemsize
+    if os.path.getsize(output) > size:
+        file = open(output, "r+b")
+        try:
+            file.truncate(size)
+        finally:
+            file.close()
+    return numpy.memmap(output, dtype, "r+", shape=shape)
 
-    def getSolutions(self, domains, constraints, vconstraints):
-        """
-        Return all solutions for the given problem
+def findSupport(constraint, variables, domains, assignments, others,
+                budget):
+    """
+    Look for values of the given variables supporting current assignments
+
+    The search extends the assignments one variable at a time, checking
+    the constraint at each step so that partial assignments which already
+    break it are abandoned early.
+
+    @param others: Variables still to be assigned
+    @type  others: list
+    @param budget: One-item list with the number of constraint checks
+                   still allowed. It's decremented in place.
+    @type  budget: list
+    @return: Sequence of (variable, value) pairs extending the given
+             assignments into a consistent one, an empty tuple when there
+             was nothing to extend, None if no support exists, or
+             L{Unknown} if the budget ran out before telling
+    """
+    if not others:
+        return ()
+    variable = others[0]
+    for value in domains[variable][:]:
+        assignments[variable] = value
+        budget[0] -= 1
+        if constraint(variables, domains, assignments):
+            support = findSupport(constraint, variables, domains,
+                                  assignments, others[1:], budget)
+            if support is Unknown:
+                del assignments[variable]
+                return Unknown
+            if support is not None:
+                del assignments[variable]
+                return ((variable, value),) + support
+        if budget[0] <= 0:
+            del assignments[variable]
+            return Unknown
+    del assignments[variable]
+    return None
+
+def doArcConsistency(domains, constraints, maxchecks=1000):
+    """
+    Enforce generalized arc consistency on the given domains
 
-        @param domains: Dictionary mapping variables to domains
-        @type  domains: dict
-        @param constraints: List of pairs of (constraint, variables)
-        @type  constraints: list
-        @param vconstraints: Dictionary mapping variables to a list of
-                             constraints affecting the given variables.
-        @type  vconstraints: dict
-        """
-        raise NotImplementedError, \
-              "%s provides only a single solution" % self.__class__.__name__
+    This is a queue based AC-3 working on binary and n-ary constraints.
+    As in AC-2001, the support found for each value is cached, and
+    revisiting an arc only searches again when some value of the cached
+    support was hidden meanwhile. Values without support are hidden, and
+    the arcs of the other constraints on that variable are queued again
+    until a fixpoint is reached.
 
-    def getSolutionIter(self, domains, constraints, vconstraints):
-        """
+    Example:
+
+    >>> domains = {"a": Domain([1, 2, 3]), "b": Domain([1, 2, 3]),
+    ...            "c": Domain([1, 2, 3])}
+    >>> constraints = [(FunctionConstraint(lambda a, b: a < b), ["a", "b"]),
+    ...                (FunctionConstraint(lambda b, c: b < c), ["b", "c"])]
+    >>> doArcConsistency(domains, constraints)
+    True
+    >>> domains["a"], domains["b"], domains["c"]
+    ([1], [2], [3])
+
+    @param domains: Dictionary mapping variables to their domains
+    @type  domains: dict
+    @param constraints: List of pairs of (constraint, variables)
+    @type  constraints: list
+    @param maxchecks: Maximum number of constraint checks performed while
+                      looking for the support of a single value. Values are
+                      considered supported when the limit is reached, and
+                      looked at again whenever their arcs are revisited.
+    @type  maxchecks: int
+    @return: False if some domain was wiped out, True otherwise
+    @rtype: bool
+    """
+    varcs = {}
+    queue = deque()
+    queued = set()
+    for index, (constraint, variables) in enumerate(constraints):
+        for position, variable in enumerate(variables):
+            varcs.setdefault(variable, []).append((index, position))
+            queue.append((index, position))
+            queued.add((index, position))
+    supports = {}
+    assignments = {}
+    while queue:
+        arc = queue.popleft()
+        queued.discard(arc)
+        index, position = arc
+        constraint, variables = constraints[index]
+        variable = variables[position]
+        domain = domains[variable]
+        others = [x for x in variables if x != variable]
+        changed = False
+        for value in domain[:]:
+            support = supports.get((index, position, value))
+            if support is not None:
+                for othervariable, othervalue in support:
+                    if othervalue not in domains[othervariable]:
+                        break
+                else:
+                    continue
+            assignments[variable] = value
+            if constraint(variables, domains, assignments):
+                support = findSupport(constraint, variables, domains,
+                                      assignments, others, [maxchecks])
+            else:
+                support = None
+            del assignments[variable]
+            if support is None:
+                domain.hideValue(value)
+                changed = True
+            elif support is not Unknown:
+                supports[(index, position, value)] = support
+        if not domain:
+            return False
+        if changed:
+            for otherarc in varcs[variable]:
+                if otherarc[0] == index:
+                    continue
+                othervariables = constraints[otherarc[0]][1]
+                for otherposition in range(len(othervariables)):
+                    if othervariables[otherposition] == variable:
+                        continue
+                    otherarc = (otherarc[0], otherposition)
+                    if otherarc not in queued:
+                        queue.append(otherarc)
+                        queued.add(otherarc)
+    return True
+
+def getComponents(domains, constraints):
+    """
+    Split a problem into the connected components of its constraint graph
+
+    Two variables are connected when some constraint affects both of
+    them. Variables without constraints make components of their own.
+
+    Example:
+
+    >>> domains = {"a": Domain([1, 2]), "b": Domain([1, 2]),
+    ...            "c": Domain([1, 2])}
+    >>> constraint = FunctionConstraint(lambda a, b: a != b)
+    >>> components = getComponents(domains, [(constraint, ["a", "b"])])
+    >>> sorted(sorted(component[0]) for component in components)
+    [['a', 'b'], ['c']]
+
+    @param domains: Dictionary mapping variables to their domains
+    @type  domains: dict
+    @param constraints: List of pairs of (constraint, variables)
+    @type  constraints: list
+    @return: List of (domains, constraints, vconstraints) tuples, one per
+             component, sharing the given domain instances
+    @rtype: list
+    """
+    parent = dict((variable, variable) for variable in domains)
+    def find(variable):
+        root = variable
+        while parent[root] != root:
+            root = parent[root]
+        while parent[variable] != root:
+            parent[variable], variable = root, parent[variable]
+        return root
+    for constraint, variables in constraints:
+        if variables:
+            root = find(variables[0])
+            for variable in variables[1:]:
+                other = find(variable)
+                if other != root:
+                    parent[other] = root
+    components = OrderedDict()
+    for variable in domains:
+        root = find(variable)
+        if root not in components:
+            components[root] = ({}, [], {})
+        subdomains, subconstraints, subvconstraints = components[root]
+        subdomains[variable] = domains[variable]
+        subvconstraints[variable] = []
+    for constraint, variables in constraints:
+        if variables:
+            subdomains, subconstraints, subvconstraints = \
+                components[find(variables[0])]
+            subconstraints.append((constraint, variables))
+            for variable in variables:
+                subvconstraints[variable].append((constraint, variables))
+    return components.values()
+
+class SolverStats(object):
+    """
+    Counters describing the work done by the last search of a solver
+
+    Example:
+
+    >>> solver = BacktrackingSolver()
+    >>> problem = Problem(solver)
+    >>> problem.addVariables(["a", "b"], [1, 2, 3])
+    >>> problem.addConstraint(lambda a, b: b > a, ["a", "b"])
+    >>> len(problem.getSolutions())
+    3
+    >>> stats = solver.getStats()
+    >>> stats.solutions, stats.maxdepth
+    (3, 2)
+
+    @ivar nodes: Number of tentative assignments (or steps, for local
+                 search solvers)
+    @ivar failures: Number of tentative assignments rejected by constraints
+    @ivar maxdepth: Largest number of variables assigned at once
+    @ivar prunes: Number of values hidden by constraint propagation
+    @ivar solutions: Number of solutions found
+    @ivar time: Wall clock time spent in the search, in seconds
+    @ivar limited: Whether the search was stopped by a time or node limit
+    @ivar calls: Dictionary mapping constraint class names to the number
+                 of calls, when profiling is enabled
+    @ivar calltime: Dictionary mapping constraint class names to the time
+                    spent in their calls, when profiling is enabled
+    """
+
+    def __init__(self):
+        self.nodes = 0
+        self.failures = 0
+        self.maxdepth = 0
+        self.prunes = 0
+        self.solutions = 0
+        self.time = 0.0
+        self.calls = {}
+        self.calltime = {}
+        self.limited = False
+        self.start = time.time()
+        self.checkpoint = -1
+        self.nextcallback = -1
+
+    def __repr__(self):
+        return ("<SolverStats nodes=%d failures=%d maxdepth=%d prunes=%d "
+                "solutions=%d time=%.3f%s>" %
+                (self.nodes, self.failures, self.maxdepth, self.prunes,
+                 self.solutions, self.time, self.limited and " limited" or ""))
+
+    def update(self, stats):
+        """
+        Accumulate the counters of another search into these ones
+
+        @param stats: Statistics to be added
+        @type  stats: L{SolverStats}
+        """
+        self.nodes += stats.nodes
+        self.failures += stats.failures
+        self.maxdepth = max(self.maxdepth, stats.maxdepth)
+        self.prunes += stats.prunes
+        self.solutions += stats.solutions
+        for name, count in stats.calls.items():
+            self.calls[name] = self.calls.get(name, 0)+count
+        for name, spent in stats.calltime.items():
+            self.calltime[name] = self.calltime.get(name, 0.0)+spent
+
+class SearchLimitReached(Exception):
+    """
+    Raised by L{Solver.checkpoint} when a time or node limit is reached
+
+    Solvers catch it and end the search, returning what they've found.
+    """
+
+class PartialSolution(dict):
+    """
+    Best assignment found by a local search stopped by a limit
+
+    @ivar conflicts: Number of constraints broken by the assignment
+    """
+
+    conflicts = 0
+
+class Solver(object):
+    """
+    Abstract base class for solvers
+
+    Solvers keep a L{SolverStats} instance describing their last search,
+    which is available through L{getStats}.
+
+    @sort: getSolution, getSolutions, getSolutionIter
+    """
+
+    _stats = None
+    _callback = None
+    _interval = 1000
+    _profile = False
+    _timeout = None
+    _maxnodes = None
+    _maxfailures = None
+    _timecheck = 100
+
+    def getStats(self):
+        """
+        Obtain the statistics of the last search performed
+
+        @return: Statistics of the last search, or None if there was none
+        @rtype: L{SolverStats}
+        """
+        return self._stats
+
+    def setProgressCallback(self, callback, interval=1000):
+        """
+        Set a function periodically called while searching
+
+        @param callback: Function called with the current L{SolverStats}
+                         every C{interval} nodes, or None to disable it
+        @type  callback: callable object
+        @param interval: Number of nodes between calls (default is 1000)
+        @type  interval: int
+        """
+        self._callback = callback
+        self._interval = interval
+
+    def setLimits(self, timeout=None, maxnodes=None, maxfailures=None):
+        """
+        Set the limits after which searches are stopped
+
+        A search stopped by a limit ends as if there were no more
+        solutions, and its statistics have the C{limited} flag set. The
+        L{Problem} methods set these limits on every call.
+
+        @param timeout: Maximum wall clock time of a search, in seconds,
+                        or None for no limit
+        @type  timeout: number
+        @param maxnodes: Maximum number of nodes (see L{SolverStats}) of
+                         a search, or None for no limit
+        @type  maxnodes: int
+        @param maxfailures: Number of failures (see L{SolverStats}) after
+                            which a search is stopped, or None for no
+                            limit. Used by L{RestartingSolver}.
+        @type  maxfailures: int
+        """
+        self._timeout = timeout
+        self._maxnodes = maxnodes
+        self._maxfailures = maxfailures
+
+    def setProfiling(self, profile):
+        """
+        Enable or disable accounting of constraint calls and time
+
+        @param profile: Whether calls to constraints should be counted
+                        and timed per constraint class
+        @type  profile: bool
+        """
+        self._profile = profile
+
+    def startStats(self, vconstraints):
+        """
+        Start the statistics of a new search
+
+        When profiling is enabled, the constraints are wrapped by
+        L{ProfiledConstraint} instances accounting in the new statistics.
+
+        @param vconstraints: Dictionary mapping variables to a list of
+                             constraints affecting the given variables.
+        @type  vconstraints: dict
+        @return: Tuple with the new statistics and the vconstraints to be
+                 used by the search
+        @rtype: tuple
+        """
+        stats = self._stats = SolverStats()
+        if self._callback:
+            stats.nextcallback = self._interval
+        stats.checkpoint = self.nextCheckpoint(stats)
+        if self._profile:
+            wrapped = {}
+            profiled = {}
+            for variable in vconstraints:
+                lst = profiled[variable] = []
+                for constraint, variables in vconstraints[variable]:
+                    key = (id(constraint), id(variables))
+                    if key not in wrapped:
+                        wrapped[key] = ProfiledConstraint(constraint, stats)
+                    lst.append((wrapped[key], variables))
+            vconstraints = profiled
+        return stats, vconstraints
+
+    def checkpoint(self, stats):
+        """
+        Called when the node count reaches C{stats.checkpoint}
+
+        @raise SearchLimitReached: If a time or node limit was reached
+        """
+        stats.time = time.time()-stats.start
+        if (self._maxnodes is not None and stats.nodes > self._maxnodes or
+            self._maxfailures is not None and
+            stats.failures >= self._maxfailures or
+            self._timeout is not None and stats.time >= self._timeout):
+            stats.limited = True
+            raise SearchLimitReached
+        if self._callback and stats.nodes >= stats.nextcallback:
+            stats.nextcallback = (stats.nodes//self._interval+1)*self._interval
+            self._callback(stats)
+        stats.checkpoint = self.nextCheckpoint(stats)
+
+    def nextCheckpoint(self, stats):
+        """
+        Compute the node count of the next call to L{checkpoint}
+
+        @return: Node count, or -1 if no checkpoints are needed
+        @rtype: int
+        """
+        checkpoints = []
+        if self._callback:
+            checkpoints.append(stats.nextcallback)
+        if self._maxnodes is not None:
+            checkpoints.append(self._maxnodes+1)
+        if self._maxfailures is not None:
+            # Every failure takes a node, so the budget can't be exceeded
+            # before this many more nodes.
+            checkpoints.append(stats.nodes+
+                               max(self._maxfailures-stats.failures, 1))
+        if self._timeout is not None:
+            checkpoints.append(stats.nodes+self._timecheck)
+        if not checkpoints:
+            return -1
+        return min(checkpoints)
+
+    def finishStats(self, stats):
+        """
+        Record the end of a search
+        """
+        stats.time = time.time()-stats.start
+
+    def setRandom(self, random):
+        """
+        Break ties between equally ranked variables randomly
+
+        Solvers without a variable ordering ignore it.
+
+        @param random: Random generator drawing the ties of each search,
+                       or None to break them deterministically
+        @type  random: C{random.Random}
+        """
+
+    def setPersistent(self, persistent):
+        """
+        Keep what was learned by previous searches when a new one starts
+
+        Learned state, such as constraint weights, saved phases or
+        nogoods, is only valid while the same problem is searched again,
+        as L{RestartingSolver} does. Solvers learning nothing ignore it.
+
+        @param persistent: Whether learned state should be kept
+        @type  persistent: bool
+        """
+
+    def getSolution(self, domains, constraints, vconstraints):
+        """
+        Return one solution for the given problem
+
+        @param domains: Dictionary mapping variables to their domains
+        @type  domains: dict
+        @param constraints: List of pairs of (constraint, variables)
+        @type  constraints: list
+        @param vconstraints: Dictionary mapping variables to a list of
+                             constraints affecting the given variables.
+        @type  vconstraints: dict
+        """
+        raise NotImplementedError, \
+              "%s is an abstract class" % self.__class__.__name__
+
+    def getSolutions(self, domains, constraints, vconstraints):
+        """
+        Return all solutions for the given problem
+
+        @param domains: Dictionary mapping variables to domains
+        @type  domains: dict
+        @param constraints: List of pairs of (constraint, variables)
+        @type  constraints: list
+        @param vconstraints: Dictionary mapping variables to a list of
+                             constraints affecting the given variables.
+        @type  vconstraints: dict
+        """
+        raise NotImplementedError, \
+              "%s provides only a single solution" % self.__class__.__name__
+
+    def getSolutionIter(self, domains, constraints, vconstraints):
+        """
         Return an iterator for the solutions of the given problem
 
         @param domains: Dictionary mapping variables to domains
@@ -409,9 +1804,1153 @@ class Solver(object):
         raise NotImplementedError, \
               "%s doesn't provide iteration" % self.__class__.__name__
 
-class BacktrackingSolver(Solver):
+    def getAssignmentIter(self, domains, constraints, vconstraints):
+        """
+        Return an iterator for the solutions, sharing a single dictionary
+
+        Solvers overriding it yield the dictionary they use internally for
+        the assignments on every solution, which is modified once the
+        search is resumed. The default implementation yields the items of
+        L{getSolutionIter}.
+
+        @param domains: Dictionary mapping variables to domains
+        @type  domains: dict
+        @param constraints: List of pairs of (constraint, variables)
+        @type  constraints: list
+        @param vconstraints: Dictionary mapping variables to a list of
+                             constraints affecting the given variables.
+        @type  vconstraints: dict
+        """
+        return self.getSolutionIter(domains, constraints, vconstraints)
+
+    def countSolutions(self, domains, constraints, vconstraints,
+                       limit=None, callback=None):
+        """
+        Count the solutions for the given problem
+
+        @param domains: Dictionary mapping variables to domains
+        @type  domains: dict
+        @param constraints: List of pairs of (constraint, variables)
+        @type  constraints: list
+        @param vconstraints: Dictionary mapping variables to a list of
+                             constraints affecting the given variables.
+        @type  vconstraints: dict
+        @param limit: Maximum number of solutions counted, or None
+        @type  limit: int
+        @param callback: Function called with each solution, or None
+        @type  callback: callable object
+        @return: Number of solutions
+        @rtype: int
+        """
+        count = 0
+        iterator = self.getAssignmentIter(domains, constraints, vconstraints)
+        if limit is not None:
+            iterator = limitIter(iterator, limit)
+        for assignments in iterator:
+            count += 1
+            if callback is not None:
+                callback(assignments)
+        return count
+
+class VariableOrdering(object):
+    """
+    Abstract base class for variable ordering heuristics
+
+    Orderings are strategy objects given to the backtracking solvers,
+    which call L{setup} when a search starts and L{select} on every
+    node. The remaining methods let an ordering follow the changes to the
+    domains and the failures found, and do nothing by default.
+    """
+
+    _random = None
+    _persistent = False
+
+    def setRandom(self, random):
+        """
+        Break ties between equally ranked variables randomly
+
+        @param random: Random generator drawing the ties of each search,
+                       or None to break them deterministically
+        @type  random: C{random.Random}
+        """
+        self._random = random
+
+    def setPersistent(self, persistent):
+        """
+        Keep what was learned by previous searches when a new one starts
+
+        @param persistent: Whether learned state should be kept
+        @type  persistent: bool
+        """
+        self._persistent = persistent
+
+    def getRanks(self, domains):
+        """
+        Draw the tie breaking rank of each variable for a new search
+
+        @return: Dictionary mapping variables to random numbers, or to
+                 zero when no random generator is set
+        @rtype: dict
+        """
+        if self._random is None:
+            return dict.fromkeys(domains, 0)
+        return dict((variable, self._random.random())
+                    for variable in domains)
+
+    def setup(self, domains, vconstraints):
+        """
+        Prepare the ordering for a new search
+
+        @param domains: Dictionary mapping variables to their domains
+        @type  domains: dict
+        @param vconstraints: Dictionary mapping variables to a list of
+                             constraints affecting the given variables.
+        @type  vconstraints: dict
+        """
+        self._domains = domains
+
+    def select(self, assignments):
+        """
+        Return the next variable to be assigned
+
+        @param assignments: Dictionary mapping assigned variables to their
+                            current assumed value
+        @type  assignments: dict
+        @return: Unassigned variable, or None if there are none left
+        """
+        raise NotImplementedError, \
+              "%s is an abstract class" % self.__class__.__name__
+
+    def update(self, trail, mark):
+        """
+        Account for values hidden since the trail had the given length
+
+        @param trail: List of domains filled by L{Domain.hideValue}
+        @type  trail: list
+        @param mark: Trail length before the values were hidden
+        @type  mark: int
+        """
+
+    def restore(self, trail, mark):
+        """
+        Restore hidden values as L{undoTrail} does, updating the ordering
+
+        @param trail: List of domains filled by L{Domain.hideValue}
+        @type  trail: list
+        @param mark: Length of the trail to go back to
+        @type  mark: int
+        """
+        undoTrail(trail, mark)
+
+    def unassign(self, variable):
+        """
+        Make a variable which was just unassigned available again
+
+        @param variable: Variable removed from the assignments
+        """
+
+    def fail(self, constraint, variables):
+        """
+        Account for a constraint rejecting an assignment
+
+        Called when the constraint fails, either because it's broken or
+        because forward checking wiped out a domain.
+
+        @param constraint: Constraint which failed
+        @type  constraint: instance of a L{Constraint} subclass
+        @param variables: Variables affected by the constraint
+        @type  variables: sequence
+        """
+
+class DegreeMRVOrdering(VariableOrdering):
+    """
+    Variable ordering mixing the Degree and Minimum Remaining Values heuristics
+
+    Unassigned variables are kept in a heap keyed on their degree and
+    current domain size, so picking the next variable is O(log n) instead
+    of sorting all variables on every search node. Entries are never
+    updated in place. When a domain shrinks or grows a new entry is
+    pushed, and entries that no longer match the domain size or belong to
+    assigned variables are discarded when they reach the top. Remaining
+    ties are broken by variable, or randomly when L{setRandom} was given
+    a generator.
+    """
+
+    def setup(self, domains, vconstraints):
+        """
+        Prepare the ordering for a new search
+
+        @param domains: Dictionary mapping variables to their domains
+        @type  domains: dict
+        @param vconstraints: Dictionary mapping variables to a list of
+                             constraints affecting the given variables.
+        @type  vconstraints: dict
+        """
+        self._domains = domains
+        self._degree = degree = {}
+        self._rank = rank = self.getRanks(domains)
+        self._variable = {}
+        for variable in domains:
+            degree[variable] = -len(vconstraints[variable])
+            self._variable[id(domains[variable])] = variable
+        self._heap = [(degree[variable], len(domains[variable]),
+                       rank[variable], variable) for variable in domains]
+        heapq.heapify(self._heap)
+        self._limit = 2*len(self._heap)+64
+
+    def select(self, assignments):
+        """
+        Return the next variable to be assigned
+
+        @param assignments: Dictionary mapping assigned variables to their
+                            current assumed value
+        @type  assignments: dict
+        @return: Unassigned variable, or None if there are none left
+        """
+        heap = self._heap
+        if len(heap) > self._limit:
+            domains = self._domains
+            degree = self._degree
+            rank = self._rank
+            heap[:] = [(degree[variable], len(domains[variable]),
+                        rank[variable], variable)
+                       for variable in domains
+                       if variable not in assignments]
+            heapq.heapify(heap)
+            self._limit = 2*len(domains)+64
+        domains = self._domains
+        while heap:
+            _, size, _, variable = heap[0]
+            if variable not in assignments and \
+               size == len(domains[variable]):
+                return variable
+            heapq.heappop(heap)
+        return None
+
+    def update(self, trail, mark):
+        """
+        Account for values hidden since the trail had the given length
+
+        @param trail: List of domains filled by L{Domain.hideValue}
+        @type  trail: list
+        @param mark: Trail length before the values were hidden
+        @type  mark: int
+        """
+        self._push(trail[mark:])
+
+    def restore(self, trail, mark):
+        """
+        Restore hidden values as L{undoTrail} does, updating the ordering
+
+        @param trail: List of domains filled by L{Domain.hideValue}
+        @type  trail: list
+        @param mark: Length of the trail to go back to
+        @type  mark: int
+        """
+        changed = trail[mark:]
+        undoTrail(trail, mark)
+        self._push(changed)
+
+    def unassign(self, variable):
+        """
+        Make a variable which was just unassigned available again
+
+        @param variable: Variable removed from the assignments
+        """
+        heapq.heappush(self._heap, (self._degree[variable],
+                                    len(self._domains[variable]),
+                                    self._rank[variable], variable))
+
+    def _push(self, changed):
+        heap = self._heap
+        degree = self._degree
+        rank = self._rank
+        seen = {}
+        for domain in changed:
+            variable = self._variable[id(domain)]
+            if variable not in seen:
+                seen[variable] = True
+                heapq.heappush(heap, (degree[variable], len(domain),
+                                      rank[variable], variable))
+
+class DomWDegOrdering(VariableOrdering):
+    """
+    Variable ordering picking the smallest domain size by weighted degree
+
+    Every constraint starts with a weight of one, increased whenever the
+    constraint rejects an assignment or wipes out a domain. Variables are
+    picked by the ratio between their current domain size and the sum of
+    the weights of their constraints, so searches focus on the hard parts
+    of the problem as they learn where it fails. Weights start afresh on
+    every search, unless L{setPersistent} asked to keep them.
+
+    Example:
+
+    >>> problem = Problem(BacktrackingSolver(ordering=DomWDegOrdering()))
+    >>> problem.addVariables(["a", "b", "c"], [1, 2, 3])
+    >>> problem.addConstraint(AllDifferentConstraint())
+    >>> problem.addConstraint(lambda a, b: a > b, ["a", "b"])
+    >>> len(problem.getSolutions())
+    3
+    """#"""
+
+    _wdeg = None
+
+    def setup(self, domains, vconstraints):
+        self._domains = domains
+        self._rank = self.getRanks(domains)
+        if self._persistent and self._wdeg is not None:
+            return
+        self._weights = {}
+        self._wdeg = wdeg = {}
+        for variable in domains:
+            wdeg[variable] = len(vconstraints[variable]) or 1
+
+    def select(self, assignments):
+        domains = self._domains
+        wdeg = self._wdeg
+        rank = self._rank
+        best = None
+        bestratio = None
+        for variable in domains:
+            if variable not in assignments:
+                ratio = float(len(domains[variable]))/wdeg[variable]
+                if best is None or ratio < bestratio or \
+                   ratio == bestratio and rank[variable] < rank[best]:
+                    best = variable
+                    bestratio = ratio
+        return best
+
+    def fail(self, constraint, variables):
+        key = (id(constraint), id(variables))
+        self._weights[key] = self._weights.get(key, 1)+1
+        wdeg = self._wdeg
+        for variable in variables:
+            wdeg[variable] += 1
+
+    def getWeight(self, constraint, variables):
+        """
+        Obtain the current weight of a constraint
+
+        @return: Weight of the constraint on the given variables
+        @rtype: int
+        """
+        return self._weights.get((id(constraint), id(variables)), 1)
+
+class ValueOrdering(object):
+    """
+    Base class for value ordering heuristics
+
+    Orderings are strategy objects given to the backtracking solvers,
+    which call L{setup} when a search starts and L{order} whenever they
+    pick a variable. This base class keeps the domain order.
+    """
+
+    _persistent = False
+
+    def setPersistent(self, persistent):
+        """
+        Keep what was learned by previous searches when a new one starts
+
+        @param persistent: Whether learned state should be kept
+        @type  persistent: bool
+        """
+        self._persistent = persistent
+
+    def setup(self, domains, vconstraints):
+        """
+        Prepare the ordering for a new search
+
+        @param domains: Dictionary mapping variables to their domains
+        @type  domains: dict
+        @param vconstraints: Dictionary mapping variables to a list of
+                             constraints affecting the given variables.
+        @type  vconstraints: dict
+        """
+
+    def order(self, variable, values, assignments):
+        """
+        Sort the values of a variable in the order they should be tried
+
+        @param variable: Variable about to be assigned
+        @param values: Values left in the variable domain. The list may be
+                       changed and returned.
+        @type  values: list
+        @param assignments: Dictionary mapping assigned variables to their
+                            current assumed value
+        @type  assignments: dict
+        @return: Values in the order they should be tried
+        @rtype: list
+        """
+        return values
+
+    def success(self, variable, value):
+        """
+        Account for a value accepted by every constraint of its variable
+
+        @param variable: Variable just assigned
+        @param value: Value assigned
+        """
+
+class LCVOrdering(ValueOrdering):
+    """
+    Value ordering trying first the least constraining values
+
+    The impact of a value is the number of values it rules out from the
+    domains of unassigned variables. The values forward checking hides
+    when the variable alone takes each value are found once per search,
+    on copies of the domains as they were when the search started, and
+    cached. Impacts then count how many of those are still present in
+    the current domains.
+
+    Example:
+
+    >>> solver = BacktrackingSolver(valueordering=LCVOrdering())
+    >>> problem = Problem(solver)
+    >>> problem.addVariables(["a", "b"], [1, 2, 3])
+    >>> problem.addConstraint(lambda a, b: a < b, ["a", "b"])
+    >>> problem.addConstraint(InSetConstraint([3]), ["b"])
+    >>> problem.getSolution()
+    {'a': 1, 'b': 3}
+    """#"""
+
+    _initial = None
+
+    def setup(self, domains, vconstraints):
+        self._domains = domains
+        self._vconstraints = vconstraints
+        if self._persistent and self._initial is not None:
+            return
+        self._initial = None
+        self._ruledout = {}
+
+    def order(self, variable, values, assignments):
+        ruledout = self._ruledout.get(variable)
+        if ruledout is None:
+            ruledout = self._ruledout[variable] = self.getRuledOut(variable)
+        domains = self._domains
+        impacts = {}
+        for value in values:
+            pairs = ruledout.get(value)
+            if pairs is None:
+                impacts[value] = sys.maxint
+                continue
+            impact = 0
+            for othervariable, othervalues in pairs:
+                if othervariable not in assignments:
+                    domain = domains[othervariable]
+                    for othervalue in othervalues:
+                        if othervalue in domain:
+                            impact += 1
+            impacts[value] = impact
+        values.sort(key=impacts.__getitem__)
+        return values
+
+    def getRuledOut(self, variable):
+        """
+        Find the values hidden by forward checking for each value
+
+        @return: Dictionary mapping each value of the variable to a list
+                 of (variable, values) pairs with the values it hides from
+                 other domains, or to None if a constraint rejects it
+        @rtype: dict
+        """
+        if self._initial is None:
+            self._initial = dict((othervariable, Domain(domain[:]))
+                                 for othervariable, domain
+                                 in self._domains.items())
+            self._variable = dict((id(domain), othervariable)
+                                  for othervariable, domain
+                                  in self._initial.items())
+        domains = self._initial
+        names = self._variable
+        trail = []
+        for domain in domains.values():
+            domain.setTrail(trail)
+        ruledout = {}
+        try:
+            for value in domains[variable][:]:
+                assignments = {variable: value}
+                for constraint, variables in self._vconstraints[variable]:
+                    if not constraint(variables, domains, assignments, True):
+                        ruledout[value] = None
+                        undoTrail(trail, 0)
+                        break
+                else:
+                    hidden = {}
+                    while trail:
+                        domain = trail.pop()
+                        hidden.setdefault(names[id(domain)],
+                                          []).append(domain.restoreValue())
+                    ruledout[value] = hidden.items()
+        finally:
+            for domain in domains.values():
+                domain.setTrail(None)
+        return ruledout
+
+class RandomValueOrdering(ValueOrdering):
+    """
+    Value ordering trying values in random order
+
+    The random generator is seeded again whenever a search starts, so
+    searches with the same seed try values in the same order, unless
+    L{setPersistent} asked to go on with the same sequence.
+
+    Example:
+
+    >>> solver = BacktrackingSolver(valueordering=RandomValueOrdering(7))
+    >>> problem = Problem(solver)
+    >>> problem.addVariables(["a", "b"], range(10))
+    >>> problem.getSolution() == problem.getSolution()
+    True
+    """#"""
+
+    def __init__(self, seed=None):
+        """
+        @param seed: Seed of the random generator (default is to seed it
+                     from system randomness)
+        @type  seed: hashable object
+        """
+        self._seed = seed
+        self._random = random.Random(seed)
+
+    def setup(self, domains, vconstraints):
+        if not self._persistent:
+            self._random.seed(self._seed)
+
+    def order(self, variable, values, assignments):
+        self._random.shuffle(values)
+        return values
+
+class PhaseSavingOrdering(ValueOrdering):
+    """
+    Value ordering trying first the last value accepted for each variable
+
+    Once a value passes every constraint of its variable, it's tried
+    first whenever the variable is picked again, so partial solutions
+    found before backtracking are rebuilt quickly. Other values follow
+    in the order given by another value ordering.
+
+    Example:
+
+    >>> solver = BacktrackingSolver(valueordering=PhaseSavingOrdering())
+    >>> problem = Problem(solver)
+    >>> problem.addVariables(["a", "b"], [1, 2, 3])
+    >>> problem.addConstraint(lambda a, b: a < b, ["a", "b"])
+    >>> len(problem.getSolutions())
+    3
+    """#"""
+
+    def __init__(self, fallback=None):
+        """
+        @param fallback: Ordering of the values besides the saved one
+                         (default is to keep the domain order)
+        @type  fallback: instance of a L{ValueOrdering} subclass
+        """
+        self._fallback = fallback or ValueOrdering()
+        self._phases = {}
+
+    def setPersistent(self, persistent):
+        self._persistent = persistent
+        self._fallback.setPersistent(persistent)
+
+    def setup(self, domains, vconstraints):
+        if not self._persistent:
+            self._phases = {}
+        self._fallback.setup(domains, vconstraints)
+
+    def order(self, variable, values, assignments):
+        values = self._fallback.order(variable, values, assignments)
+        phase = self._phases.get(variable, values)
+        if phase is not values and phase in values and values[0] != phase:
+            values.remove(phase)
+            values.insert(0, phase)
+        return values
+
+    def success(self, variable, value):
+        self._phases[variable] = value
+        self._fallback.success(variable, value)
+
+class BacktrackingSolver(Solver):
+    """
+    Problem solver with backtracking capabilities
+
+    Examples:
+
+    >>> result = [[('a', 1), ('b', 2)],
+    ...           [('a', 1), ('b', 3)],
+    ...           [('a', 2), ('b', 3)]]
+
+    >>> problem = Problem(BacktrackingSolver())
+    >>> problem.addVariables(["a", "b"], [1, 2, 3])
+    >>> problem.addConstraint(lambda a, b: b > a, ["a", "b"])
+
+    >>> solution = problem.getSolution()
+    >>> sorted(solution.items()) in result
+    True
+
+    >>> for solution in problem.getSolutionIter():
+    ...     sorted(solution.items()) in result
+    True
+    True
+    True
+
+    >>> for solution in problem.getSolutions():
+    ...     sorted(solution.items()) in result
+    True
+    True
+    True
+    """#"""
+
+    def __init__(self, forwardcheck=True, ordering=None,
+                 valueordering=None):
+        """
+        @param forwardcheck: If false forward checking will not be requested
+                             to constraints while looking for solutions
+                             (default is true)
+        @type  forwardcheck: bool
+        @param ordering: Variable ordering heuristic (default is a new
+                         L{DegreeMRVOrdering})
+        @type  ordering: instance of a L{VariableOrdering} subclass
+        @param valueordering: Value ordering heuristic (default is to try
+                              values in the domain order)
+        @type  valueordering: instance of a L{ValueOrdering} subclass
+        """
+        self._forwardcheck = forwardcheck
+        self._ordering = ordering or DegreeMRVOrdering()
+        self._valueordering = valueordering
+
+    def setRandom(self, random):
+        self._ordering.setRandom(random)
+
+    def setPersistent(self, persistent):
+        self._ordering.setPersistent(persistent)
+        if self._valueordering is not None:
+            self._valueordering.setPersistent(persistent)
+
+    def getSolutionIter(self, domains, constraints, vconstraints):
+        for assignments in self.getAssignmentIter(domains, constraints,
+                                                  vconstraints):
+            yield assignments.copy()
+
+    def getAssignmentIter(self, domains, constraints, vconstraints):
+        forwardcheck = self._forwardcheck
+        assignments = {}
+
+        queue = []
+
+        stats, vconstraints = self.startStats(vconstraints)
+
+        # Values hidden by forward checking are recorded in the trail, and
+        # each queued variable keeps the trail length from before its
+        # assignment, so backtracking restores just what was pruned.
+        trail = []
+        for domain in domains.values():
+            domain.setTrail(trail)
+
+        ordering = self._ordering
+        ordering.setup(domains, vconstraints)
+        valueordering = self._valueordering
+        if valueordering is not None:
+            valueordering.setup(domains, vconstraints)
+
+        try:
+            while True:
+
+                variable = ordering.select(assignments)
+                if variable is not None:
+                    values = domains[variable][:]
+                    if valueordering is not None:
+                        # Values are popped from the end.
+                        values = valueordering.order(variable, values,
+                                                     assignments)
+                        values.reverse()
+                else:
+                    # No unassigned variables. We've got a solution. Go back
+                    # to last variable, if there's one.
+                    stats.solutions += 1
+                    yield assignments
+                    if not queue:
+                        return
+                    variable, values, mark = queue.pop()
+                    ordering.restore(trail, mark)
+
+                while True:
+                    # We have a variable. Do we have any values left?
+                    if not values:
+                        # No. Go back to last variable, if there's one.
+                        del assignments[variable]
+                        ordering.unassign(variable)
+                        while queue:
+                            variable, values, mark = queue.pop()
+                            ordering.restore(trail, mark)
+                            if values:
+                                break
+                            del assignments[variable]
+                            ordering.unassign(variable)
+                        else:
+                            return
+
+                    # Got a value. Check it.
+                    assignments[variable] = values.pop()
+
+                    stats.nodes += 1
+                    if stats.nodes == stats.checkpoint:
+                        self.checkpoint(stats)
+
+                    mark = len(trail)
+
+                    for constraint, variables in vconstraints[variable]:
+                        if not constraint(variables, domains, assignments,
+                                          forwardcheck):
+                            # Value is not good.
+                            ordering.fail(constraint, variables)
+                            break
+                    else:
+                        break
+
+                    stats.failures += 1
+                    stats.prunes += len(trail)-mark
+                    undoTrail(trail, mark)
+
+                stats.prunes += len(trail)-mark
+                if len(assignments) > stats.maxdepth:
+                    stats.maxdepth = len(assignments)
+                ordering.update(trail, mark)
+                if valueordering is not None:
+                    valueordering.success(variable, assignments[variable])
+
+                # Push state before looking for next variable.
+                queue.append((variable, values, mark))
+        except SearchLimitReached:
+            return
+        finally:
+            undoTrail(trail, 0)
+            for domain in domains.values():
+                domain.setTrail(None)
+            self.finishStats(stats)
+
+        raise RuntimeError, "Can't happen"
+
+    def getSolution(self, domains, constraints, vconstraints):
+        iter = self.getSolutionIter(domains, constraints, vconstraints)
+        try:
+            return iter.next()
+        except StopIteration:
+            return None
+
+    def getSolutions(self, domains, constraints, vconstraints):
+        return list(self.getSolutionIter(domains, constraints, vconstraints))
+
+
+class RecursiveBacktrackingSolver(Solver):
+    """
+    Recursive problem solver with backtracking capabilities
+
+    Examples:
+
+    >>> result = [[('a', 1), ('b', 2)],
+    ...           [('a', 1), ('b', 3)],
+    ...           [('a', 2), ('b', 3)]]
+
+    >>> problem = Problem(RecursiveBacktrackingSolver())
+    >>> problem.addVariables(["a", "b"], [1, 2, 3])
+    >>> problem.addConstraint(lambda a, b: b > a, ["a", "b"])
+
+    >>> solution = problem.getSolution()
+    >>> sorted(solution.items()) in result
+    True
+
+    >>> for solution in problem.getSolutionIter():
+    ...     sorted(solution.items()) in result
+    True
+    True
+    True
+
+    >>> for solution in problem.getSolutions():
+    ...     sorted(solution.items()) in result
+    True
+    True
+    True
+    """#"""
+
+    def __init__(self, forwardcheck=True, ordering=None,
+                 valueordering=None):
+        """
+        @param forwardcheck: If false forward checking will not be requested
+                             to constraints while looking for solutions
+                             (default is true)
+        @type  forwardcheck: bool
+        @param ordering: Variable ordering heuristic (default is a new
+                         L{DegreeMRVOrdering})
+        @type  ordering: instance of a L{VariableOrdering} subclass
+        @param valueordering: Value ordering heuristic (default is to try
+                              values in the domain order)
+        @type  valueordering: instance of a L{ValueOrdering} subclass
+        """
+        self._forwardcheck = forwardcheck
+        self._ordering = ordering or DegreeMRVOrdering()
+        self._valueordering = valueordering
+
+    def setRandom(self, random):
+        self._ordering.setRandom(random)
+
+    def setPersistent(self, persistent):
+        self._ordering.setPersistent(persistent)
+        if self._valueordering is not None:
+            self._valueordering.setPersistent(persistent)
+
+    def recursiveBacktracking(self, solutions, domains, vconstraints,
+                              assignments, single):
+        iterator = self.recursiveSearch(domains, vconstraints, assignments)
+        try:
+            for assignments in iterator:
+                solutions.append(assignments.copy())
+                if single:
+                    break
+        finally:
+            iterator.close()
+        return solutions
+
+    def recursiveSearch(self, domains, vconstraints, assignments):
+        """
+        Return an iterator for the solutions extending the given assignments
+
+        The given dictionary is yielded on every solution, and changes once
+        the search is resumed.
+        """
+        # Record values hidden by forward checking in a trail, so that
+        # each level restores only what it pruned.
+        trail = []
+        for domain in domains.values():
+            domain.setTrail(trail)
+        stats, vconstraints = self.startStats(vconstraints)
+        ordering = self._ordering
+        ordering.setup(domains, vconstraints)
+        if self._valueordering is not None:
+            self._valueordering.setup(domains, vconstraints)
+        try:
+            for solution in self.recursiveAssign(domains, vconstraints,
+                                                 assignments, trail,
+                                                 ordering, stats):
+                yield solution
+        except SearchLimitReached:
+            return
+        finally:
+            undoTrail(trail, 0)
+            for domain in domains.values():
+                domain.setTrail(None)
+            self.finishStats(stats)
+
+    def recursiveAssign(self, domains, vconstraints, assignments, trail,
+                        ordering, stats):
+        variable = ordering.select(assignments)
+        if variable is None:
+            # No unassigned variables. We've got a solution.
+            stats.solutions += 1
+            yield assignments
+            return
+
+        assignments[variable] = None
+
+        forwardcheck = self._forwardcheck
+        valueordering = self._valueordering
+        if valueordering is None:
+            values = domains[variable]
+        else:
+            values = valueordering.order(variable, domains[variable][:],
+                                         assignments)
+
+        for value in values:
+            assignments[variable] = value
+            stats.nodes += 1
+            if stats.nodes == stats.checkpoint:
+                self.checkpoint(stats)
+            mark = len(trail)
+            for constraint, variables in vconstraints[variable]:
+                if not constraint(variables, domains, assignments,
+                                  forwardcheck):
+                    # Value is not good.
+                    ordering.fail(constraint, variables)
+                    stats.failures += 1
+                    stats.prunes += len(trail)-mark
+                    undoTrail(trail, mark)
+                    break
+            else:
+                # Value is good. Recurse and get next variable.
+                stats.prunes += len(trail)-mark
+                if len(assignments) > stats.maxdepth:
+                    stats.maxdepth = len(assignments)
+                ordering.update(trail, mark)
+                if valueordering is not None:
+                    valueordering.success(variable, value)
+                for solution in self.recursiveAssign(domains, vconstraints,
+                                                     assignments, trail,
+                                                     ordering, stats):
+                    yield solution
+                ordering.restore(trail, mark)
+        del assignments[variable]
+        ordering.unassign(variable)
+
+    def getSolution(self, domains, constraints, vconstraints):
+        solutions = self.recursiveBacktracking([], domains, vconstraints,
+                                               {}, True)
+        return solutions and solutions[0] or None
+
+    def getSolutions(self, domains, constraints, vconstraints):
+        return self.recursiveBacktracking([], domains, vconstraints,
+                                          {}, False)
+
+    def getSolutionIter(self, domains, constraints, vconstraints):
+        for assignments in self.recursiveSearch(domains, vconstraints, {}):
+            yield assignments.copy()
+
+    def getAssignmentIter(self, domains, constraints, vconstraints):
+        return self.recursiveSearch(domains, vconstraints, {})
+
+
+class MinConflictsSolver(Solver):
+    """
+    Problem solver based on the minimum conflicts theory
+
+    Examples:
+
+    >>> result = [[('a', 1), ('b', 2)],
+    ...           [('a', 1), ('b', 3)],
+    ...           [('a', 2), ('b', 3)]]
+
+    >>> problem = Problem(MinConflictsSolver())
+    >>> problem.addVariables(["a", "b"], [1, 2, 3])
+    >>> problem.addConstraint(lambda a, b: b > a, ["a", "b"])
+
+    >>> solution = problem.getSolution()
+    >>> sorted(solution.items()) in result
+    True
+
+    >>> problem.getSolutions()
+    Traceback (most recent call last):
+       ...
+    NotImplementedError: MinConflictsSolver provides only a single solution
+
+    >>> problem.getSolutionIter()
+    Traceback (most recent call last):
+       ...
+    NotImplementedError: MinConflictsSolver doesn't provide iteration
+
+    Tabu tenure, random walk noise and restarts help escaping plateaus
+    and local minima:
+
+    >>> problem.setSolver(MinConflictsSolver(tabu=2, noise=0.1, restarts=3))
+    >>> solution = problem.getSolution()
+    >>> sorted(solution.items()) in result
+    True
+
+    When the steps run out, None is returned, as for other solvers. The
+    best assignment found is only returned as a L{PartialSolution} when
+    a time or node limit stops the search:
+
+    >>> problem = Problem(MinConflictsSolver(steps=10))
+    >>> problem.addVariables(["a", "b"], [1])
+    >>> problem.addConstraint(lambda a, b: a != b, ["a", "b"])
+    >>> problem.getSolution() is None
+    True
+    """#"""
+
+    def __init__(self, steps=1000, tabu=0, noise=0.0, restarts=0):
+        """
+        @param steps: Maximum number of steps to perform before giving up
+                      when looking for a solution (default is 1000). In each
+                      step, every variable in conflict is repaired once.
+        @type  steps: int
+        @param tabu: Number of repairs during which a variable may not go
+                     back to a value it has just left (default is 0)
+        @type  tabu: int
+        @param noise: Probability of repairing a variable with a random
+                      value instead of a minimum conflicts one (default is 0)
+        @type  noise: float
+        @param restarts: Number of times the search starts over from a new
+                         random assignment after running out of steps
+                         (default is 0)
+        @type  restarts: int
+        """
+        self._steps = steps
+        self._tabu = tabu
+        self._noise = noise
+        self._restarts = restarts
+
+    def getSolution(self, domains, constraints, vconstraints):
+        stats, vconstraints = self.startStats(vconstraints)
+        # Fewest broken constraints seen, and the assignment breaking them.
+        best = [None, None]
+        try:
+            for _ in xrange(self._restarts+1):
+                solution = self.minConflicts(domains, vconstraints, stats,
+                                             best)
+                if solution is not None:
+                    return solution
+            return None
+        except SearchLimitReached:
+            if best[1] is None:
+                return None
+            solution = PartialSolution(best[1])
+            solution.conflicts = best[0]
+            return solution
+        finally:
+            self.finishStats(stats)
+
+    def minConflicts(self, domains, vconstraints, stats, best=None):
+        # Number the constraints, and map variables to the constraints
+        # affecting them.
+        constraints = []
+        vindexes = {}
+        seen = {}
+        for variable in domains:
+            lst = vindexes[variable] = []
+            for item in vconstraints[variable]:
+                key = (id(item[0]), id(item[1]))
+                if key not in seen:
+                    seen[key] = len(constraints)
+                    constraints.append(item)
+                lst.append(seen[key])
+        scopes = [set(variables) for _, variables in constraints]
+
+        assignments = {}
+        # Initial assignment
+        for variable in domains:
+            assignments[variable] = random.choice(domains[variable])
+
+        # Keep which constraints are broken, how many broken constraints
+        # each variable is part of, and the set of variables in conflict,
+        # as a list with positions for constant time random choices.
+        broken = [not constraint(variables, domains, assignments)
+                  for constraint, variables in constraints]
+        counts = dict.fromkeys(domains, 0)
+        for index, scope in enumerate(scopes):
+            if broken[index]:
+                for variable in scope:
+                    counts[variable] += 1
+        conflicted = []
+        positions = {}
+        for variable in domains:
+            if counts[variable]:
+                positions[variable] = len(conflicted)
+                conflicted.append(variable)
+        nbroken = broken.count(True)
+        if best is None:
+            best = [None, None]
+        if best[0] is None or nbroken < best[0]:
+            best[:] = [nbroken, assignments.copy()]
+
+        tabu = {}
+        tenure = self._tabu
+        noise = self._noise
+        repairs = 0
+
+        for _ in xrange(self._steps):
+            if not conflicted:
+                stats.solutions += 1
+                stats.maxdepth = len(assignments)
+                return assignments
+            lst = conflicted[:]
+            random.shuffle(lst)
+            for variable in lst:
+                if not counts[variable]:
+                    # Fixed by a previous repair in this step.
+                    continue
+                stats.nodes += 1
+                if stats.nodes == stats.checkpoint:
+                    self.checkpoint(stats)
+                repairs += 1
+                current = assignments[variable]
+                indexes = vindexes[variable]
+                if noise and random.random() < noise:
+                    value = random.choice(domains[variable])
+                else:
+                    # Find values with less conflicts, preferring the
+                    # ones which are not tabu.
+                    mincount = len(indexes)+1
+                    minvalues = []
+                    mintabu = []
+                    for value in domains[variable]:
+                        assignments[variable] = value
+                        count = 0
+                        for index in indexes:
+                            constraint, variables = constraints[index]
+                            if not constraint(variables, domains,
+                                              assignments):
+                                count += 1
+                        if tabu and tabu.get((variable, value), 0) > repairs:
+                            if not minvalues:
+                                mintabu.append((count, value))
+                            continue
+                        if count == mincount:
+                            minvalues.append(value)
+                        elif count < mincount:
+                            mincount = count
+                            minvalues = [value]
+                    if not minvalues:
+                        mincount = min(mintabu)[0]
+                        minvalues = [x for count, x in mintabu
+                                     if count == mincount]
+                    # Pick a random one from these values.
+                    value = random.choice(minvalues)
+                assignments[variable] = value
+                if value == current:
+                    continue
+                if tenure:
+                    tabu[(variable, current)] = repairs+tenure
+                # Update the constraints of the variable, and the counts
+                # of their variables.
+                for index in indexes:
+                    constraint, variables = constraints[index]
+                    isbroken = not constraint(variables, domains, assignments)
+                    if isbroken == broken[index]:
+                        continue
+                    broken[index] = isbroken
+                    if isbroken:
+                        delta = 1
+                    else:
+                        delta = -1
+                    nbroken += delta
+                    for othervariable in scopes[index]:
+                        count = counts[othervariable] = \
+                                counts[othervariable]+delta
+                        if count == 0:
+                            # Remove it from the conflicted list.
+                            position = positions.pop(othervariable)
+                            last = conflicted.pop()
+                            if last != othervariable:
+                                conflicted[position] = last
+                                positions[last] = position
+                        elif count == 1 and delta == 1:
+                            positions[othervariable] = len(conflicted)
+                            conflicted.append(othervariable)
+                if nbroken < best[0]:
+                    best[:] = [nbroken, assignments.copy()]
+        if not conflicted:
+            stats.solutions += 1
+            stats.maxdepth = len(assignments)
+            return assignments
+        return None
+
+class ParallelSolver(Solver):
     """
-    Problem solver with backtracking capabilities
+    Problem solver distributing the backtracking search among processes
+
+    The values of the first variable picked by the variable ordering
+    heuristic define the initial subproblems, which are put in a queue
+    shared by the worker processes. Each worker solves its subproblem
+    with forward checking backtracking, and whenever some worker is
+    waiting for work, busy workers give away the untried values of their
+    shallowest pending variable as new subproblems. Solutions are sent
+    back as soon as they're found, in no particular order.
+
+    Workers are forked, so constraints don't need to be picklable, but
+    variables and values do.
+
+    Workers add up their nodes every C{interval} nodes, so searches may
+    go somewhat past a node limit. When a limit stops the search, the
+    statistics and solution counts only cover finished subproblems.
 
     Examples:
 
@@ -419,7 +2958,7 @@ class BacktrackingSolver(Solver):
     ...           [('a', 1), ('b', 3)],
     ...           [('a', 2), ('b', 3)]]
 
-    >>> problem = Problem(BacktrackingSolver())
+    >>> problem = Problem(ParallelSolver(workers=2))
     >>> problem.addVariables(["a", "b"], [1, 2, 3])
     >>> problem.addConstraint(lambda a, b: b > a, ["a", "b"])
 
@@ -427,284 +2966,1581 @@ class BacktrackingSolver(Solver):
     >>> sorted(solution.items()) in result
     True
 
-    >>> for solution in problem.getSolutionIter():
-    ...     sorted(solution.items()) in result
-    True
-    True
+    >>> sorted(sorted(x.items()) for x in problem.getSolutions()) == result
     True
 
-    >>> for solution in problem.getSolutions():
-    ...     sorted(solution.items()) in result
-    True
+    Splitting after every node stresses the hand-off of subproblems
+    between workers, which must never lose any of them:
+
+    >>> def build(solver):
+    ...     problem = Problem(solver)
+    ...     problem.addVariables(range(9), range(9))
+    ...     for i in range(9):
+    ...         for j in range(i+1, 8):
+    ...             problem.addConstraint(lambda a, b, d=j-i:
+    ...                                   a != b and abs(a-b) != d, (i, j))
+    ...     return problem
+    >>> expected = build(BacktrackingSolver()).countSolutions()
+    >>> problem = build(ParallelSolver(workers=8, interval=1))
+    >>> counts = [problem.countSolutions() for i in range(10)]
+    >>> counts == [expected]*10
     True
+    >>> len(problem.getSolutions()) == expected
     True
     """#"""
 
-    def __init__(self, forwardcheck=True):
+    def __init__(self, workers=None, forwardcheck=True, interval=64,
+                 batch=100, ordering=None, valueordering=None):
         """
+        @param workers: Number of worker processes (default is the number
+                        of CPUs)
+        @type  workers: int
         @param forwardcheck: If false forward checking will not be requested
                              to constraints while looking for solutions
                              (default is true)
         @type  forwardcheck: bool
+        @param interval: Number of search nodes between checks for idle
+                         workers (default is 64)
+        @type  interval: int
+        @param batch: Maximum number of solutions a worker holds before
+                      sending them back (default is 100)
+        @type  batch: int
+        @param ordering: Variable ordering heuristic used by the workers
+                         (default is a new L{DegreeMRVOrdering})
+        @type  ordering: instance of a L{VariableOrdering} subclass
+        @param valueordering: Value ordering heuristic used by the workers
+                              (default is to try values in the domain
+                              order)
+        @type  valueordering: instance of a L{ValueOrdering} subclass
         """
+        self._workers = workers or multiprocessing.cpu_count()
         self._forwardcheck = forwardcheck
+        self._splitinterval = interval
+        self._batch = batch
+        self._ordering = ordering or DegreeMRVOrdering()
+        self._valueordering = valueordering
 
     def getSolutionIter(self, domains, constraints, vconstraints):
-        forwardcheck = self._forwardcheck
-        assignments = {}
+        return self.distribute(domains, vconstraints, True)
+
+    def countSolutions(self, domains, constraints, vconstraints,
+                       limit=None, callback=None):
+        if limit is not None or callback is not None:
+            return Solver.countSolutions(self, domains, constraints,
+                                         vconstraints, limit, callback)
+        # Workers just count, without sending solutions back.
+        for solution in self.distribute(domains, vconstraints, False):
+            pass
+        return self._stats.solutions
+
+    def distribute(self, domains, vconstraints, send):
+        """
+        Run the workers and return an iterator for the solutions found
 
-        queue = []
+        @param send: Whether workers should send solutions back, or just
+                     count them in the statistics
+        @type  send: bool
+        """
+        stats, vconstraints = self.startStats(vconstraints)
+        ordering = self._ordering
+        ordering.setup(domains, vconstraints)
+        variable = ordering.select({})
+        tasks = multiprocessing.Queue()
+        results = multiprocessing.Queue()
+        idle = multiprocessing.Value("i", 0)
+        spent = multiprocessing.Value("l", 0)
+        outstanding = 0
+        for value in domains[variable]:
+            tasks.put([(variable, value)])
+            outstanding += 1
+        processes = []
+        for _ in range(self._workers):
+            process = multiprocessing.Process(target=self.work,
+                                              args=(domains, vconstraints,
+                                                    tasks, results, idle,
+                                                    send, spent))
+            process.daemon = True
+            process.start()
+            processes.append(process)
+        if self._timeout is not None:
+            deadline = stats.start+self._timeout
+        else:
+            deadline = None
+        try:
+            while outstanding:
+                if deadline is None:
+                    kind, data = results.get()
+                else:
+                    try:
+                        wait = max(deadline-time.time(), 0)
+                        kind, data = results.get(True, wait)
+                    except Empty:
+                        stats.limited = True
+                        return
+                if kind == "solutions":
+                    for solution in data:
+                        yield solution
+                elif kind == "split":
+                    # Counted before they're queued, so no worker can
+                    # finish them before they're accounted for.
+                    outstanding += len(data)
+                    for prefix in data:
+                        tasks.put(prefix)
+                elif kind == "done":
+                    outstanding -= 1
+                    stats.update(data)
+                    if data.limited:
+                        stats.limited = True
+                        return
+                    if stats.checkpoint != -1 and \
+                       stats.nodes >= stats.checkpoint:
+                        self.checkpoint(stats)
+                else:
+                    raise RuntimeError, "Worker failed:\n%s" % data
+        except SearchLimitReached:
+            return
+        finally:
+            if outstanding:
+                for process in processes:
+                    process.terminate()
+            else:
+                for process in processes:
+                    tasks.put(None)
+            for process in processes:
+                process.join()
+            self.finishStats(stats)
+
+    def getSolution(self, domains, constraints, vconstraints):
+        iter = self.getSolutionIter(domains, constraints, vconstraints)
+        try:
+            return iter.next()
+        except StopIteration:
+            return None
+        finally:
+            iter.close()
+
+    def getSolutions(self, domains, constraints, vconstraints):
+        return list(self.getSolutionIter(domains, constraints, vconstraints))
+
+    def work(self, domains, vconstraints, tasks, results, idle, send=True,
+             spent=None):
+        """
+        Main loop of worker processes
 
+        Subproblems are taken from the tasks queue until a None is found,
+        and messages are put in the results queue: C{("solutions", list)}
+        for found solutions, C{("split", list)} with new subproblems to be
+        queued by the master, C{("done", stats)} when a subproblem is
+        finished, and C{("error", text)} if something went wrong.
+        """
+        # The forked statistics are the ones profiled constraints account
+        # in, so they're reset in place after being sent with each result.
+        stats = self._stats
+        stats.__init__()
         while True:
+            with idle.get_lock():
+                idle.value += 1
+            prefix = tasks.get()
+            with idle.get_lock():
+                idle.value -= 1
+            if prefix is None:
+                return
+            try:
+                self.solveSubproblem(prefix, domains, vconstraints,
+                                     tasks, results, idle, stats, send,
+                                     spent)
+            except Exception:
+                results.put(("error", traceback.format_exc()))
+                return
+            # Queues pickle in a background thread, so send a copy.
+            results.put(("done", copy.copy(stats)))
+            stats.__init__()
+
+    def solveSubproblem(self, prefix, domains, vconstraints, tasks, results,
+                        idle, stats, send=True, spent=None):
+        """
+        Look for all solutions extending the given partial assignment
+
+        @param prefix: Sequence of (variable, value) pairs defining the
+                       subproblem
+        @type  prefix: list
+        @param stats: Statistics where the search is accounted
+        @type  stats: L{SolverStats}
+        @param send: Whether solutions should be sent back
+        @type  send: bool
+        @param spent: Shared count of the nodes explored by all workers,
+                      checked against the node limit
+        @type  spent: C{multiprocessing.Value}
+        """
+        forwardcheck = self._forwardcheck
+        assignments = {}
+        solutions = []
+        trail = []
+        for domain in domains.values():
+            domain.setTrail(trail)
+        try:
+            for variable, value in prefix:
+                if value not in domains[variable]:
+                    return
+                assignments[variable] = value
+                for constraint, variables in vconstraints[variable]:
+                    if not constraint(variables, domains, assignments,
+                                      forwardcheck):
+                        return
+
+            ordering = self._ordering
+            ordering.setup(domains, vconstraints)
+            valueordering = self._valueordering
+            if valueordering is not None:
+                valueordering.setup(domains, vconstraints)
+            queue = []
+            nextsplit = self._splitinterval
 
-            # Mix the Degree and Minimum Remaing Values (MRV) heuristics
-            lst = [(-len(vconstraints[variable]),
-                    len(domains[variable]), variable) for variable in domains]
-            lst.sort()
-            for item in lst:
-                if item[-1] not in assignments:
-                    # Found unassigned variable
-                    variable = item[-1]
+            while True:
+                variable = ordering.select(assignments)
+                if variable is not None:
                     values = domains[variable][:]
-                    if forwardcheck:
-                        pushdomains = [domains[x] for x in domains
-                                                   if x not in assignments and
-                                                      x != variable]
+                    if valueordering is not None:
+                        # Values are popped from the end.
+                        values = valueordering.order(variable, values,
+                                                     assignments)
+                        values.reverse()
+                else:
+                    stats.solutions += 1
+                    if send:
+                        solutions.append(assignments.copy())
+                    if len(solutions) >= self._batch:
+                        results.put(("solutions", solutions))
+                        solutions = []
+                    if not queue:
+                        return
+                    variable, values, mark = queue.pop()
+                    ordering.restore(trail, mark)
+
+                while True:
+                    if not values:
+                        del assignments[variable]
+                        ordering.unassign(variable)
+                        while queue:
+                            variable, values, mark = queue.pop()
+                            ordering.restore(trail, mark)
+                            if values:
+                                break
+                            del assignments[variable]
+                            ordering.unassign(variable)
+                        else:
+                            return
+
+                    assignments[variable] = values.pop()
+                    stats.nodes += 1
+
+                    mark = len(trail)
+
+                    for constraint, variables in vconstraints[variable]:
+                        if not constraint(variables, domains, assignments,
+                                          forwardcheck):
+                            ordering.fail(constraint, variables)
+                            break
                     else:
-                        pushdomains = None
+                        break
+
+                    stats.failures += 1
+                    stats.prunes += len(trail)-mark
+                    undoTrail(trail, mark)
+
+                stats.prunes += len(trail)-mark
+                if len(assignments) > stats.maxdepth:
+                    stats.maxdepth = len(assignments)
+                ordering.update(trail, mark)
+                if valueordering is not None:
+                    valueordering.success(variable, assignments[variable])
+                queue.append((variable, values, mark))
+
+                if stats.nodes >= nextsplit:
+                    if spent is not None and self._maxnodes is not None:
+                        with spent.get_lock():
+                            spent.value += stats.nodes-nextsplit+ \
+                                           self._splitinterval
+                            if spent.value > self._maxnodes:
+                                stats.limited = True
+                                return
+                    nextsplit = stats.nodes+self._splitinterval
+                    if idle.value > 0:
+                        self.split(prefix, queue, assignments, results)
+        finally:
+            if solutions:
+                results.put(("solutions", solutions))
+            undoTrail(trail, 0)
+            for domain in domains.values():
+                domain.setTrail(None)
+
+    def split(self, prefix, queue, assignments, results):
+        """
+        Give away the untried values of the shallowest pending variable
+
+        Each value becomes a new subproblem, and the values are removed
+        from the local search queue so they're not explored twice. The
+        subproblems are sent to the master process, which queues them.
+        """
+        for index, (variable, values, mark) in enumerate(queue):
+            if values:
+                base = prefix+[(x[0], assignments[x[0]])
+                               for x in queue[:index]]
+                results.put(("split", [base+[(variable, value)]
+                                       for value in values]))
+                del values[:]
+                return
+
+class BackjumpingSolver(Solver):
+    """
+    Problem solver with conflict-directed backjumping and nogood learning
+
+    Variables are assigned in a static degree/domain size order. When a
+    value breaks a constraint, the assigned variables of that constraint
+    are added to the conflict set of the variable being assigned. Once
+    all its values have failed, the search jumps straight back to the
+    deepest variable of that conflict set, instead of the previous one,
+    and passes the rest of the conflict set along to it.
+
+    The assignment of the conflict set of an exhausted variable is also
+    recorded as a nogood, a combination of values that can't be part of
+    any solution. Nogoods are checked on every assignment, and the least
+    recently used ones are evicted when the store is full. Nogoods are
+    forgotten when a new search starts, unless L{setPersistent} asked to
+    keep them.
+
+    Examples:
+
+    >>> result = [[('a', 1), ('b', 2)],
+    ...           [('a', 1), ('b', 3)],
+    ...           [('a', 2), ('b', 3)]]
+
+    >>> problem = Problem(BackjumpingSolver())
+    >>> problem.addVariables(["a", "b"], [1, 2, 3])
+    >>> problem.addConstraint(lambda a, b: b > a, ["a", "b"])
+
+    >>> solution = problem.getSolution()
+    >>> sorted(solution.items()) in result
+    True
+
+    >>> for solution in problem.getSolutionIter():
+    ...     sorted(solution.items()) in result
+    True
+    True
+    True
+
+    >>> sorted(sorted(x.items()) for x in problem.getSolutions()) == result
+    True
+    """#"""
+
+    def __init__(self, nogoods=1000):
+        """
+        @param nogoods: Maximum number of learned nogoods kept (default is
+                        1000). Zero disables learning.
+        @type  nogoods: int
+        """
+        self._maxnogoods = nogoods
+        self._random = None
+        self._persistent = False
+        self._nogoods = None
+
+    def setRandom(self, random):
+        self._random = random
+
+    def setPersistent(self, persistent):
+        self._persistent = persistent
+
+    def getSolutionIter(self, domains, constraints, vconstraints):
+        for assignments in self.getAssignmentIter(domains, constraints,
+                                                  vconstraints):
+            yield assignments.copy()
+
+    def getAssignmentIter(self, domains, constraints, vconstraints):
+        rand = self._random
+        order = [(-len(vconstraints[variable]), len(domains[variable]),
+                  rand and rand.random() or 0, variable)
+                 for variable in domains]
+        order.sort()
+        order = [item[-1] for item in order]
+        position = dict((variable, level)
+                        for level, variable in enumerate(order))
+
+        if not self._persistent or self._nogoods is None:
+            self._nogoods = OrderedDict()
+            self._watches = {}
+
+        stats, vconstraints = self.startStats(vconstraints)
+
+        try:
+            for item in self.backjump(domains, vconstraints, order,
+                                      position, stats):
+                yield item
+        except SearchLimitReached:
+            return
+        finally:
+            self.finishStats(stats)
+
+    def backjump(self, domains, vconstraints, order, position, stats):
+        count = len(order)
+        assignments = {}
+        values = [None]*count
+        conflicts = [None]*count
+        # Conflict sets which include variables only because solutions
+        # were found below them don't explain a failure, so they must
+        # not be learned.
+        tainted = [False]*count
+
+        level = 0
+        values[0] = domains[order[0]][:]
+        conflicts[0] = set()
+
+        while True:
+            if level == count:
+                stats.solutions += 1
+                yield assignments
+                # Go back chronologically from here.
+                level = count-1
+                del assignments[order[level]]
+                conflicts[level] = set(order[:level])
+                tainted = [True]*count
+
+            variable = order[level]
+            levelvalues = values[level]
+            while levelvalues:
+                value = levelvalues.pop()
+                assignments[variable] = value
+                stats.nodes += 1
+                if stats.nodes == stats.checkpoint:
+                    self.checkpoint(stats)
+                culprits = self.check(variable, domains, vconstraints,
+                                      assignments)
+                if culprits is None:
                     break
+                stats.failures += 1
+                conflicts[level].update(culprits)
+                del assignments[variable]
             else:
-                # No unassigned variables. We've got a solution. Go back
-                # to last variable, if there's one.
-                yield assignments.copy()
-                if not queue:
+                # Dead end. Jump to the deepest variable in conflict.
+                conflict = conflicts[level]
+                if not conflict:
                     return
-                variable, values, pushdomains = queue.pop()
-                if pushdomains:
-                    for domain in pushdomains:
-                        domain.popState()
+                if not tainted[level]:
+                    self.learn(conflict, assignments)
+                target = max([position[x] for x in conflict])
+                conflict.discard(order[target])
+                conflicts[target].update(conflict)
+                tainted[target] = tainted[target] or tainted[level]
+                for otherlevel in range(target, level):
+                    del assignments[order[otherlevel]]
+                level = target
+                continue
+
+            level += 1
+            if level > stats.maxdepth:
+                stats.maxdepth = level
+            if level < count:
+                values[level] = domains[order[level]][:]
+                conflicts[level] = set()
+                tainted[level] = False
 
-            while True:
-                # We have a variable. Do we have any values left?
-                if not values:
-                    # No. Go back to last variable, if there's one.
-                    del assignments[variable]
-                    while queue:
-                        variable, values, pushdomains = queue.pop()
-                        if pushdomains:
-                            for domain in pushdomains:
-                                domain.popState()
-                        if values:
-                            break
-                        del assignments[variable]
-                    else:
-                        return
+    def getSolution(self, domains, constraints, vconstraints):
+        iter = self.getSolutionIter(domains, constraints, vconstraints)
+        try:
+            return iter.next()
+        except StopIteration:
+            return None
 
-                # Got a value. Check it.
-                assignments[variable] = values.pop()
+    def getSolutions(self, domains, constraints, vconstraints):
+        return list(self.getSolutionIter(domains, constraints, vconstraints))
 
-                if pushdomains:
-                    for domain in pushdomains:
-                        domain.pushState()
+    def check(self, variable, domains, vconstraints, assignments):
+        """
+        Check the assignment of a variable against constraints and nogoods
 
-                for constraint, variables in vconstraints[variable]:
-                    if not constraint(variables, domains, assignments,
-                                      pushdomains):
-                        # Value is not good.
+        @return: None if the assignment is consistent, or the set of other
+                 assigned variables involved in the failure
+        @rtype: set
+        """
+        value = assignments[variable]
+        watches = self._watches.get((variable, value))
+        if watches:
+            for nogood in watches:
+                for othervariable, othervalue in nogood:
+                    if othervariable != variable and \
+                       (othervariable not in assignments or
+                        assignments[othervariable] != othervalue):
                         break
                 else:
-                    break
+                    # Nogood matched. Mark it as recently used.
+                    self._nogoods[nogood] = self._nogoods.pop(nogood)
+                    return set([x for x, _ in nogood if x != variable])
+        for constraint, variables in vconstraints[variable]:
+            if not constraint(variables, domains, assignments):
+                return set([x for x in variables
+                            if x in assignments and x != variable])
+        return None
+
+    def learn(self, conflict, assignments):
+        """
+        Record the assignment of the given variables as a nogood
+        """
+        if not self._maxnogoods:
+            return
+        nogood = frozenset([(x, assignments[x]) for x in conflict])
+        if nogood in self._nogoods:
+            return
+        if len(self._nogoods) >= self._maxnogoods:
+            evicted, _ = self._nogoods.popitem(last=False)
+            for item in evicted:
+                self._watches[item].discard(evicted)
+        self._nogoods[nogood] = True
+        for item in nogood:
+            self._watches.setdefault(item, set()).add(nogood)
+
+class PortfolioSolver(Solver):
+    """
+    Problem solver racing several solvers in parallel processes
 
-                if pushdomains:
-                    for domain in pushdomains:
-                        domain.popState()
+    Every configured solver looks for a solution in its own forked
+    process. The first solution found is returned and the other
+    processes are terminated. Solvers which exceed their time budget are
+    terminated as well, and C{None} is returned if none of them finds a
+    solution. A time limit set with L{setLimits} caps every budget, and a
+    node limit applies to each solver separately. Each process reseeds
+    the C{random} module, so local search solvers in the portfolio don't
+    all walk the same path.
 
-            # Push state before looking for next variable.
-            queue.append((variable, values, pushdomains))
+    Examples:
 
-        raise RuntimeError, "Can't happen"
+    >>> result = [[('a', 1), ('b', 2)],
+    ...           [('a', 1), ('b', 3)],
+    ...           [('a', 2), ('b', 3)]]
+
+    >>> solver = PortfolioSolver([BacktrackingSolver(),
+    ...                           ("local", MinConflictsSolver())], seed=0)
+    >>> problem = Problem(solver)
+    >>> problem.addVariables(["a", "b"], [1, 2, 3])
+    >>> problem.addConstraint(lambda a, b: b > a, ["a", "b"])
+
+    >>> solution = problem.getSolution()
+    >>> sorted(solution.items()) in result
+    True
+    >>> solver.getWinner() in ("BacktrackingSolver", "local")
+    True
+
+    >>> problem.getSolutions()
+    Traceback (most recent call last):
+       ...
+    NotImplementedError: PortfolioSolver provides only a single solution
+    """#"""
+
+    def __init__(self, solvers, timeout=None, seed=None):
+        """
+        @param solvers: Solvers to race, optionally given as (name, solver)
+                        pairs. Unnamed solvers are named after their class.
+        @type  solvers: sequence
+        @param timeout: Time budget of each solver in seconds, either a
+                        single number for all of them or a sequence with one
+                        item per solver (default is no limit)
+        @type  timeout: number or sequence of numbers
+        @param seed: If given, the process of the M{i}-th solver seeds the
+                     C{random} module with C{seed+i}. Otherwise it's seeded
+                     from system randomness.
+        @type  seed: int
+        """
+        self._names = []
+        self._solvers = []
+        for item in solvers:
+            if isinstance(item, tuple):
+                name, solver = item
+            else:
+                name, solver = item.__class__.__name__, item
+            self._names.append(name)
+            self._solvers.append(solver)
+        if timeout is None or isinstance(timeout, (int, long, float)):
+            timeout = [timeout]*len(self._solvers)
+        self._timeouts = list(timeout)
+        self._seed = seed
+        self._winner = None
+
+    def getWinner(self):
+        """
+        Obtain the name of the solver which found the last solution
+
+        @return: Name of the winning solver, or None if no solver found a
+                 solution in the last search
+        @rtype: string
+        """
+        return self._winner
 
     def getSolution(self, domains, constraints, vconstraints):
-        iter = self.getSolutionIter(domains, constraints, vconstraints)
+        self._winner = None
+        self._stats = None
+        start = time.time()
+        limited = False
+        results = multiprocessing.Queue()
+        processes = []
+        deadlines = []
+        for index, solver in enumerate(self._solvers):
+            process = multiprocessing.Process(target=self.race,
+                                              args=(index, solver, domains,
+                                                    constraints,
+                                                    vconstraints, results))
+            process.daemon = True
+            process.start()
+            processes.append(process)
+            timeouts = [timeout for timeout in (self._timeouts[index],
+                                                self._timeout)
+                        if timeout is not None]
+            if timeouts:
+                deadlines.append(start+min(timeouts))
+            else:
+                deadlines.append(None)
+        running = set(range(len(processes)))
+        errors = []
         try:
-            return iter.next()
-        except StopIteration:
+            while running:
+                pending = [deadlines[index] for index in running
+                           if deadlines[index] is not None]
+                if pending:
+                    wait = max(min(pending)-time.time(), 0)
+                else:
+                    wait = None
+                try:
+                    index, solution, stats = results.get(True, wait)
+                except Empty:
+                    # Budget exceeded.
+                    now = time.time()
+                    if self._timeout is not None and \
+                       now >= start+self._timeout:
+                        limited = True
+                    for index in list(running):
+                        if deadlines[index] is not None and \
+                           deadlines[index] <= now:
+                            processes[index].terminate()
+                            running.discard(index)
+                    continue
+                running.discard(index)
+                if isinstance(solution, str):
+                    errors.append(solution)
+                elif solution is not None:
+                    self._winner = self._names[index]
+                    self._stats = stats
+                    return solution
+                elif stats is not None and stats.limited:
+                    limited = True
+            if errors and len(errors) == len(processes):
+                raise RuntimeError, "All solvers failed:\n%s" % errors[0]
+            if limited:
+                self._stats = SolverStats()
+                self._stats.limited = True
+                self.finishStats(self._stats)
+            return None
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+                process.join()
+
+    def race(self, index, solver, domains, constraints, vconstraints,
+             results):
+        """
+        Run one of the solvers in a worker process
+
+        A C{(index, solution, stats)} tuple is put in the results queue
+        when done, with a string in place of the solution if the solver
+        failed.
+        """
+        if self._seed is None:
+            random.seed()
+        else:
+            random.seed(self._seed+index)
+        if self._maxnodes is not None:
+            solver.setLimits(solver._timeout, self._maxnodes)
+        try:
+            solution = solver.getSolution(domains, constraints, vconstraints)
+            if isinstance(solution, PartialSolution):
+                solution = None
+        except Exception:
+            results.put((index, traceback.format_exc(), None))
+        else:
+            results.put((index, solution, solver.getStats()))
+
+class RestartingSolver(Solver):
+    """
+    Problem solver restarting another solver with growing failure budgets
+
+    Backtracking searches often take wildly different times depending on
+    early choices. This solver runs the wrapped one with a budget of
+    failures, and starts it again with a larger budget whenever it's
+    exhausted, breaking ties in the variable ordering randomly so every
+    run explores a different part of the search space. Budgets follow
+    either the Luby sequence (1, 1, 2, 1, 1, 2, 4, ...) or a geometric
+    progression, multiplied by the given scale.
+
+    Learned state of the wrapped solver, such as L{DomWDegOrdering}
+    weights, L{PhaseSavingOrdering} phases or L{BackjumpingSolver}
+    nogoods, is kept across the restarts of a search. The statistics add
+    up those of every run.
+
+    Examples:
+
+    >>> result = [[('a', 1), ('b', 2)],
+    ...           [('a', 1), ('b', 3)],
+    ...           [('a', 2), ('b', 3)]]
+
+    >>> solver = RestartingSolver(BacktrackingSolver(), seed=0)
+    >>> problem = Problem(solver)
+    >>> problem.addVariables(["a", "b"], [1, 2, 3])
+    >>> problem.addConstraint(lambda a, b: b > a, ["a", "b"])
+
+    >>> solution = problem.getSolution()
+    >>> sorted(solution.items()) in result
+    True
+
+    >>> problem.getSolutions()
+    Traceback (most recent call last):
+       ...
+    NotImplementedError: RestartingSolver provides only a single solution
+
+    >>> [RestartingSolver(solver).getBudget(i) for i in range(7)]
+    [100, 100, 200, 100, 100, 200, 400]
+    >>> [RestartingSolver(solver, "geometric", 10).getBudget(i)
+    ...  for i in range(4)]
+    [10, 15, 22, 33]
+    """#"""
+
+    def __init__(self, solver, schedule="luby", scale=100, factor=1.5,
+                 seed=None):
+        """
+        @param solver: Solver to be restarted, usually a
+                       L{BacktrackingSolver}, L{RecursiveBacktrackingSolver}
+                       or L{BackjumpingSolver}
+        @type  solver: instance of a L{Solver} subclass
+        @param schedule: Either "luby" or "geometric" (default is "luby")
+        @type  schedule: string
+        @param scale: Failure budget of the first run (default is 100)
+        @type  scale: int
+        @param factor: Growth of the budget between runs of the
+                       geometric schedule (default is 1.5)
+        @type  factor: float
+        @param seed: Seed of the generator breaking ties, reseeded
+                     whenever a search starts (default is to seed it from
+                     system randomness)
+        @type  seed: hashable object
+        """
+        if schedule not in ("luby", "geometric"):
+            raise ValueError, "Unknown restart schedule %r" % schedule
+        self._solver = solver
+        self._schedule = schedule
+        self._scale = scale
+        self._factor = factor
+        self._seed = seed
+        self._random = random.Random(seed)
+        self._restarts = 0
+
+    def getRestarts(self):
+        """
+        Obtain the number of restarts of the last search
+
+        @rtype: int
+        """
+        return self._restarts
+
+    def getBudget(self, restart):
+        """
+        Compute the failure budget of a run
+
+        @param restart: Number of restarts before the run
+        @type  restart: int
+        @rtype: int
+        """
+        if self._schedule == "geometric":
+            return int(self._scale*self._factor**restart)
+        index = restart+1
+        while True:
+            power = 1
+            while (1 << power)-1 < index:
+                power += 1
+            if (1 << power)-1 == index:
+                return self._scale*(1 << (power-1))
+            index -= (1 << (power-1))-1
+
+    def getSolution(self, domains, constraints, vconstraints):
+        solver = self._solver
+        stats = self._stats = SolverStats()
+        self._restarts = 0
+        self._random.seed(self._seed)
+        solver.setRandom(self._random)
+        try:
+            while True:
+                timeout = maxnodes = None
+                if self._timeout is not None:
+                    timeout = self._timeout-(time.time()-stats.start)
+                    if timeout <= 0:
+                        stats.limited = True
+                        return None
+                if self._maxnodes is not None:
+                    maxnodes = self._maxnodes-stats.nodes
+                budget = self.getBudget(self._restarts)
+                solver.setLimits(timeout, maxnodes, budget)
+                solution = solver.getSolution(domains, constraints,
+                                              vconstraints)
+                runstats = solver.getStats()
+                if runstats is not None:
+                    stats.update(runstats)
+                if solution is not None or runstats is None or \
+                   not runstats.limited:
+                    return solution
+                if runstats.failures < budget:
+                    # Stopped by the time or node limit.
+                    stats.limited = True
+                    return None
+                self._restarts += 1
+                solver.setPersistent(True)
+        finally:
+            solver.setPersistent(False)
+            solver.setRandom(None)
+            solver.setLimits()
+            self.finishStats(stats)
+
+class DecomposingSolver(Solver):
+    """
+    Problem solver handling independent parts of a problem separately
+
+    The constraint graph is split into its connected components (see
+    L{getComponents}), and the wrapped solver searches each of them on
+    its own, so a failure in one part never causes backtracking over
+    another. A single solution merges one solution of each component.
+    Enumerations take the cross product of the solutions of each
+    component lazily, and counts multiply the count of each component,
+    so the product is never built.
+
+    With more than one worker, components are solved in forked
+    processes, as in L{ParallelSolver}: constraints don't need to be
+    picklable, but variables and values do. Iterating still searches the
+    largest component lazily in the calling process.
+
+    Limits cover the whole search. When solving in processes, a node
+    limit applies to each component separately. The statistics add up
+    those of every component.
+
+    Examples:
+
+    >>> problem = Problem(DecomposingSolver())
+    >>> problem.addVariables(["a", "b", "c", "d"], range(10))
+    >>> problem.addConstraint(lambda a, b: b == a+5, ["a", "b"])
+    >>> problem.addConstraint(lambda c, d: c+d == 3, ["c", "d"])
+    >>> problem.countSolutions()
+    20
+    >>> problem.countSolutions(limit=7)
+    7
+    >>> solution = problem.getSolution()
+    >>> solution["b"]-solution["a"], solution["c"]+solution["d"]
+    (5, 3)
+    >>> len(problem.getSolutions())
+    20
+
+    >>> problem.setSolver(DecomposingSolver(workers=2))
+    >>> problem.countSolutions()
+    20
+    >>> len(problem.getSolutions())
+    20
+    """#"""
+
+    def __init__(self, solver=None, workers=1):
+        """
+        @param solver: Solver used for each component (default is a new
+                       L{BacktrackingSolver})
+        @type  solver: instance of a L{Solver} subclass
+        @param workers: Number of processes solving components at once,
+                        or None for the number of CPUs (default is 1,
+                        solving them in the calling process)
+        @type  workers: int
+        """
+        self._solver = solver or BacktrackingSolver()
+        self._workers = workers or multiprocessing.cpu_count()
+
+    def setRandom(self, random):
+        self._solver.setRandom(random)
+
+    def setPersistent(self, persistent):
+        self._solver.setPersistent(persistent)
+
+    def getSolution(self, domains, constraints, vconstraints):
+        stats = self._stats = SolverStats()
+        try:
+            results = self.solveComponents(getComponents(domains, constraints),
+                                           "one", stats)
+            if results is None:
+                return None
+            conflicts = 0
+            solution = {}
+            for result in results:
+                if isinstance(result, PartialSolution):
+                    conflicts += result.conflicts
+                solution.update(result)
+            if conflicts:
+                solution = PartialSolution(solution)
+                solution.conflicts = conflicts
+            return solution
+        finally:
+            self._solver.setLimits()
+            self.finishStats(stats)
+
+    def getSolutions(self, domains, constraints, vconstraints):
+        return list(self.getSolutionIter(domains, constraints, vconstraints))
+
+    def getSolutionIter(self, domains, constraints, vconstraints):
+        for assignments in self.getAssignmentIter(domains, constraints,
+                                                  vconstraints):
+            yield assignments.copy()
+
+    def getAssignmentIter(self, domains, constraints, vconstraints):
+        solver = self._solver
+        stats = self._stats = SolverStats()
+        try:
+            components = getComponents(domains, constraints)
+            largest = max(components, key=lambda x: len(x[0]))
+            components.remove(largest)
+            results = self.solveComponents(components, "all", stats)
+            if results is None:
+                return
+            try:
+                self.setComponentLimits(stats)
+            except SearchLimitReached:
+                return
+            iterator = solver.getAssignmentIter(*largest)
+            try:
+                assignments = {}
+                for solution in iterator:
+                    assignments.update(solution)
+                    for combination in itertools.product(*results):
+                        for other in combination:
+                            assignments.update(other)
+                        yield assignments
+            finally:
+                close = getattr(iterator, "close", None)
+                if close is not None:
+                    close()
+                runstats = solver.getStats()
+                if runstats is not None:
+                    stats.update(runstats)
+                    stats.limited = stats.limited or runstats.limited
+        finally:
+            solver.setLimits()
+            self.finishStats(stats)
+
+    def countSolutions(self, domains, constraints, vconstraints,
+                       limit=None, callback=None):
+        if callback is not None:
+            return Solver.countSolutions(self, domains, constraints,
+                                         vconstraints, limit, callback)
+        stats = self._stats = SolverStats()
+        try:
+            # Counting each component up to the limit is enough to tell
+            # whether their product reaches it.
+            counts = self.solveComponents(getComponents(domains, constraints),
+                                          "count", stats, limit)
+            if counts is None:
+                return 0
+            count = reduce(lambda x, y: x*y, counts, 1)
+            if limit is not None:
+                count = min(count, limit)
+            return count
+        finally:
+            self._solver.setLimits()
+            self.finishStats(stats)
+
+    def setComponentLimits(self, stats):
+        """
+        Set the limits left for the next component on the wrapped solver
+
+        @raise SearchLimitReached: If a limit was already reached
+        """
+        timeout = maxnodes = None
+        if self._timeout is not None:
+            timeout = self._timeout-(time.time()-stats.start)
+            if timeout <= 0:
+                stats.limited = True
+        if self._maxnodes is not None:
+            maxnodes = self._maxnodes-stats.nodes
+            if maxnodes <= 0:
+                stats.limited = True
+        if stats.limited:
+            raise SearchLimitReached
+        self._solver.setLimits(timeout, maxnodes)
+
+    def solveComponents(self, components, mode, stats, limit=None):
+        """
+        Solve each of the given components
+
+        @param components: Components as returned by L{getComponents}
+        @type  components: list
+        @param mode: "one" to find a solution of each component, "all"
+                     to find all of them, or "count" to count them
+        @type  mode: string
+        @param stats: Statistics where the searches are accounted
+        @type  stats: L{SolverStats}
+        @param limit: Maximum number of solutions counted per component
+        @type  limit: int
+        @return: List with the result of each component, or None if some
+                 component has no solutions or a limit was reached
+        @rtype: list
+        """
+        if self._workers > 1 and len(components) > 1:
+            return self.distribute(components, mode, stats, limit)
+        results = []
+        try:
+            for component in components:
+                self.setComponentLimits(stats)
+                result = self.solveComponent(self._solver, component, mode,
+                                             limit)
+                runstats = self._solver.getStats()
+                if runstats is not None:
+                    stats.update(runstats)
+                    stats.limited = stats.limited or runstats.limited
+                if not result:
+                    return None
+                results.append(result)
+        except SearchLimitReached:
             return None
+        return results
+
+    def solveComponent(self, solver, component, mode, limit=None):
+        """
+        Solve a single component with the given solver
 
-    def getSolutions(self, domains, constraints, vconstraints):
-        return list(self.getSolutionIter(domains, constraints, vconstraints))
+        @return: A solution, a list of solutions or a count, depending on
+                 the mode
+        """
+        domains, constraints, vconstraints = component
+        if mode == "one":
+            return solver.getSolution(domains, constraints, vconstraints)
+        if mode == "all":
+            return solver.getSolutions(domains, constraints, vconstraints)
+        return solver.countSolutions(domains, constraints, vconstraints,
+                                     limit)
+
+    def distribute(self, components, mode, stats, limit=None):
+        """
+        Solve the components in worker processes
 
+        @see: L{solveComponents}
+        """
+        tasks = multiprocessing.Queue()
+        results = multiprocessing.Queue()
+        for index in range(len(components)):
+            tasks.put(index)
+        processes = []
+        for _ in range(min(self._workers, len(components))):
+            tasks.put(None)
+            process = multiprocessing.Process(target=self.work,
+                                              args=(components, mode, limit,
+                                                    tasks, results))
+            process.daemon = True
+            process.start()
+            processes.append(process)
+        if self._timeout is not None:
+            deadline = stats.start+self._timeout
+        else:
+            deadline = None
+        solved = [None]*len(components)
+        outstanding = len(components)
+        try:
+            while outstanding:
+                try:
+                    if deadline is None:
+                        index, result, runstats = results.get()
+                    else:
+                        index, result, runstats = \
+                            results.get(True, max(deadline-time.time(), 0))
+                except Empty:
+                    stats.limited = True
+                    return None
+                if isinstance(result, str):
+                    raise RuntimeError, "Worker failed:\n%s" % result
+                outstanding -= 1
+                if runstats is not None:
+                    stats.update(runstats)
+                    stats.limited = stats.limited or runstats.limited
+                if not result:
+                    return None
+                solved[index] = result
+            return solved
+        finally:
+            for process in processes:
+                if outstanding and process.is_alive():
+                    process.terminate()
+                process.join()
+
+    def work(self, components, mode, limit, tasks, results):
+        """
+        Main loop of worker processes
 
-class RecursiveBacktrackingSolver(Solver):
+        Component indices are taken from the tasks queue until a None is
+        found, and a C{(index, result, stats)} tuple is put in the results
+        queue for each of them, with a string in place of the result if
+        the solver failed.
+        """
+        solver = self._solver
+        solver.setLimits(self._timeout, self._maxnodes)
+        while True:
+            index = tasks.get()
+            if index is None:
+                return
+            try:
+                result = self.solveComponent(solver, components[index], mode,
+                                             limit)
+            except Exception:
+                results.put((index, traceback.format_exc(), None))
+                return
+            results.put((index, result, solver.getStats()))
+
+class TreeSolver(Solver):
     """
-    Recursive problem solver with backtracking capabilities
+    Problem solver for constraint graphs which are trees or nearly so
+
+    A cycle cutset is chosen first: a set of variables whose removal
+    leaves every constraint with at most two variables, and the
+    constraint graph of the other variables without cycles. For each
+    consistent assignment of the cutset, the remaining forest is made
+    directionally arc consistent, from the leaves up to the roots, and
+    then solutions are assigned from the roots down without ever
+    backtracking. Counting solutions multiplies the number of supports
+    along the forest instead of enumerating them.
+
+    The work is linear in the number of variables for each cutset
+    assignment, so it pays off for sparse graphs such as maps. When the
+    cutset is larger than the given limit, the problem is handed to a
+    fallback solver instead.
 
     Examples:
 
-    >>> result = [[('a', 1), ('b', 2)],
-    ...           [('a', 1), ('b', 3)],
-    ...           [('a', 2), ('b', 3)]]
-
-    >>> problem = Problem(RecursiveBacktrackingSolver())
-    >>> problem.addVariables(["a", "b"], [1, 2, 3])
-    >>> problem.addConstraint(lambda a, b: b > a, ["a", "b"])
+    >>> problem = Problem(TreeSolver())
+    >>> problem.addVariables(["a", "b", "c", "d", "e"], [1, 2, 3])
+    >>> for pair in ["ab", "bc", "ca", "cd", "de"]:
+    ...     problem.addConstraint(lambda x, y: x != y, pair)
+    >>> problem.countSolutions()
+    24
+    >>> len(problem.getSolutions())
+    24
+    >>> len(problem.getSolver().getCutset())
+    1
 
     >>> solution = problem.getSolution()
-    >>> sorted(solution.items()) in result
+    >>> solution["c"] != solution["d"] != solution["e"]
     True
+    """#"""
 
-    >>> for solution in problem.getSolutions():
-    ...     sorted(solution.items()) in result
-    True
-    True
-    True
+    def __init__(self, maxcutset=5, fallback=None):
+        """
+        @param maxcutset: Largest cutset searched by this solver (default
+                          is 5)
+        @type  maxcutset: int
+        @param fallback: Solver used when the cutset is larger (default is
+                         a new L{BacktrackingSolver})
+        @type  fallback: instance of a L{Solver} subclass
+        """
+        self._maxcutset = maxcutset
+        self._fallback = fallback or BacktrackingSolver()
+        self._cutset = None
+        self._delegated = False
 
-    >>> problem.getSolutionIter()
-    Traceback (most recent call last):
-       ...
-    NotImplementedError: RecursiveBacktrackingSolver doesn't provide iteration
-    """#"""
+    def getStats(self):
+        if self._delegated:
+            return self._fallback.getStats()
+        return self._stats
 
-    def __init__(self, forwardcheck=True):
+    def getCutset(self):
         """
-        @param forwardcheck: If false forward checking will not be requested
-                             to constraints while looking for solutions
-                             (default is true)
-        @type  forwardcheck: bool
+        Obtain the cutset of the last search
+
+        @return: Variables in the cutset, or None if the last search was
+                 handed to the fallback solver
+        @rtype: list
         """
-        self._forwardcheck = forwardcheck
+        return self._cutset
 
-    def recursiveBacktracking(self, solutions, domains, vconstraints,
-                              assignments, single):
+    def setRandom(self, random):
+        self._fallback.setRandom(random)
 
-        # Mix the Degree and Minimum Remaing Values (MRV) heuristics
-        lst = [(-len(vconstraints[variable]),
-                len(domains[variable]), variable) for variable in domains]
-        lst.sort()
-        for item in lst:
-            if item[-1] not in assignments:
-                # Found an unassigned variable. Let's go.
-                break
-        else:
-            # No unassigned variables. We've got a solution.
-            solutions.append(assignments.copy())
-            return solutions
+    def setPersistent(self, persistent):
+        self._fallback.setPersistent(persistent)
 
-        variable = item[-1]
-        assignments[variable] = None
+    def findCutset(self, domains, constraints):
+        """
+        Choose variables whose removal leaves a forest
 
-        forwardcheck = self._forwardcheck
-        if forwardcheck:
-            pushdomains = [domains[x] for x in domains if x not in assignments]
-        else:
-            pushdomains = None
+        Constraints on more than two variables give their most
+        constrained variables to the cutset until two are left. Then
+        leaves are removed from the constraint graph repeatedly, and
+        while some cycle remains, the variable with most neighbours is
+        moved to the cutset.
+
+        @param domains: Dictionary mapping variables to their domains
+        @type  domains: dict
+        @param constraints: List of pairs of (constraint, variables)
+        @type  constraints: list
+        @return: Variables in the cutset
+        @rtype: list
+        """
+        cutset = []
+        incutset = set()
+        degree = dict((variable, 0) for variable in domains)
+        for constraint, variables in constraints:
+            for variable in variables:
+                degree[variable] += 1
+        for constraint, variables in constraints:
+            remaining = [x for x in variables if x not in incutset]
+            while len(remaining) > 2:
+                variable = max(remaining, key=degree.get)
+                remaining.remove(variable)
+                cutset.append(variable)
+                incutset.add(variable)
+        neighbours = dict((variable, set()) for variable in domains
+                          if variable not in incutset)
+        for constraint, variables in constraints:
+            remaining = [x for x in variables if x not in incutset]
+            if len(remaining) == 2:
+                x, y = remaining
+                neighbours[x].add(y)
+                neighbours[y].add(x)
+        pending = [x for x in neighbours if len(neighbours[x]) <= 1]
+        while neighbours:
+            if pending:
+                variable = pending.pop()
+                if variable not in neighbours:
+                    continue
+            else:
+                variable = max(neighbours, key=lambda x: len(neighbours[x]))
+                cutset.append(variable)
+            for other in neighbours.pop(variable):
+                neighbours[other].discard(variable)
+                if len(neighbours[other]) <= 1:
+                    pending.append(other)
+        return cutset
+
+    def getForest(self, domains, vconstraints, cutset):
+        """
+        Arrange the variables out of the cutset as a forest
+
+        @return: Tuple with the variables in breadth first order, the
+                 parent and children of each one, the constraints left
+                 with a single variable of the forest, the constraints
+                 between each variable and its parent, and the constraints
+                 checked once each cutset variable is assigned
+        @rtype: tuple
+        """
+        incutset = set(cutset)
+        position = dict((variable, index)
+                        for index, variable in enumerate(cutset))
+        entries = []
+        seen = set()
+        for variable in domains:
+            for entry in vconstraints[variable]:
+                key = (id(entry[0]), id(entry[1]))
+                if key not in seen:
+                    seen.add(key)
+                    entries.append(entry)
+        neighbours = dict((variable, set()) for variable in domains
+                          if variable not in incutset)
+        for constraint, variables in entries:
+            remaining = [x for x in variables if x not in incutset]
+            if len(remaining) == 2:
+                x, y = remaining
+                neighbours[x].add(y)
+                neighbours[y].add(x)
+        order = []
+        parent = {}
+        children = dict((variable, []) for variable in neighbours)
+        for root in neighbours:
+            if root in parent:
+                continue
+            parent[root] = None
+            queue = deque([root])
+            while queue:
+                variable = queue.popleft()
+                order.append(variable)
+                for other in neighbours[variable]:
+                    if other not in parent:
+                        parent[other] = variable
+                        children[variable].append(other)
+                        queue.append(other)
+        checks = [[] for variable in cutset]
+        unary = dict((variable, []) for variable in neighbours)
+        edges = dict((variable, []) for variable in neighbours)
+        for entry in entries:
+            variables = entry[1]
+            remaining = [x for x in variables if x not in incutset]
+            if not remaining:
+                checks[max([position[x] for x in variables])].append(entry)
+            elif len(remaining) == 1:
+                unary[remaining[0]].append(entry)
+            else:
+                x, y = remaining
+                if parent[x] == y:
+                    edges[x].append(entry)
+                else:
+                    edges[y].append(entry)
+        return order, parent, children, unary, edges, checks
+
+    def assignCutset(self, domains, cutset, checks, assignments, stats,
+                     level=0):
+        """
+        Yield every consistent assignment of the cutset
 
+        The same assignments dictionary is yielded every time.
+        """
+        if level == len(cutset):
+            yield assignments
+            return
+        variable = cutset[level]
         for value in domains[variable]:
             assignments[variable] = value
-            if pushdomains:
-                for domain in pushdomains:
-                    domain.pushState()
-            for constraint, variables in vconstraints[variable]:
-                if not constraint(variables, domains, assignments,
-                                  pushdomains):
-                    # Value is not good.
+            stats.nodes += 1
+            if stats.nodes == stats.checkpoint:
+                self.checkpoint(stats)
+            for constraint, variables in checks[level]:
+                if not constraint(variables, domains, assignments):
+                    stats.failures += 1
                     break
             else:
-                # Value is good. Recurse and get next variable.
-                self.recursiveBacktracking(solutions, domains, vconstraints,
-                                           assignments, single)
-                if solutions and single:
-                    return solutions
-            if pushdomains:
-                for domain in pushdomains:
-                    domain.popState()
+                if level+1 > stats.maxdepth:
+                    stats.maxdepth = level+1
+                for assignments in self.assignCutset(domains, cutset, checks,
+                                                     assignments, stats,
+                                                     level+1):
+                    yield assignments
         del assignments[variable]
-        return solutions
-
-    def getSolution(self, domains, constraints, vconstraints):
-        solutions = self.recursiveBacktracking([], domains, vconstraints,
-                                               {}, True)
-        return solutions and solutions[0] or None
 
-    def getSolutions(self, domains, constraints, vconstraints):
-        return self.recursiveBacktracking([], domains, vconstraints,
-                                          {}, False)
+    def filterForest(self, domains, forest, assignments, stats):
+        """
+        Make the forest directionally arc consistent
 
+        Values are handled as positions in the domains, so they don't
+        need to be hashable.
 
-class MinConflictsSolver(Solver):
-    """
-    Problem solver based on the minimum conflicts theory
+        @return: Tuple with the positions of the values left for each
+                 variable, and for each variable but the roots, a
+                 dictionary mapping positions of values of its parent to
+                 the positions of its own values supporting them. None is
+                 returned if some domain is wiped out.
+        @rtype: tuple
+        """
+        order, parent, children, unary, edges, checks = forest
+        values = {}
+        for variable in order:
+            domain = domains[variable]
+            kept = []
+            for index in range(len(domain)):
+                assignments[variable] = domain[index]
+                for constraint, variables in unary[variable]:
+                    if not constraint(variables, domains, assignments):
+                        stats.prunes += 1
+                        break
+                else:
+                    kept.append(index)
+            assignments.pop(variable, None)
+            if not kept:
+                return None
+            values[variable] = kept
+        supports = {}
+        for variable in reversed(order):
+            above = parent[variable]
+            if above is None:
+                continue
+            domain = domains[variable]
+            abovedomain = domains[above]
+            table = {}
+            kept = []
+            for aboveindex in values[above]:
+                assignments[above] = abovedomain[aboveindex]
+                supported = []
+                for index in values[variable]:
+                    assignments[variable] = domain[index]
+                    for constraint, variables in edges[variable]:
+                        if not constraint(variables, domains, assignments):
+                            break
+                    else:
+                        supported.append(index)
+                if supported:
+                    table[aboveindex] = supported
+                    kept.append(aboveindex)
+                else:
+                    stats.prunes += 1
+            del assignments[above]
+            del assignments[variable]
+            if not kept:
+                return None
+            values[above] = kept
+            supports[variable] = table
+        return values, supports
+
+    def assignForest(self, domains, forest, filtered, assignments, stats):
+        """
+        Yield every solution of a filtered forest, without backtracking
 
-    Examples:
+        The same assignments dictionary is yielded every time.
+        """
+        order, parent, children, unary, edges, checks = forest
+        values, supports = filtered
+        if not order:
+            yield assignments
+            return
+        depth = len(checks)
+        chosen = {}
+        iterators = [None]*len(order)
+        iterators[0] = iter(values[order[0]])
+        level = 0
+        while level >= 0:
+            variable = order[level]
+            for index in iterators[level]:
+                break
+            else:
+                del assignments[variable]
+                level -= 1
+                continue
+            chosen[variable] = index
+            assignments[variable] = domains[variable][index]
+            stats.nodes += 1
+            if stats.nodes == stats.checkpoint:
+                self.checkpoint(stats)
+            if depth+level+1 > stats.maxdepth:
+                stats.maxdepth = depth+level+1
+            if level+1 == len(order):
+                yield assignments
+                continue
+            level += 1
+            below = order[level]
+            above = parent[below]
+            if above is None:
+                iterators[level] = iter(values[below])
+            else:
+                iterators[level] = iter(supports[below][chosen[above]])
 
-    >>> result = [[('a', 1), ('b', 2)],
-    ...           [('a', 1), ('b', 3)],
-    ...           [('a', 2), ('b', 3)]]
+    def countForest(self, forest, filtered):
+        """
+        Count the solutions of a filtered forest
 
-    >>> problem = Problem(MinConflictsSolver())
-    >>> problem.addVariables(["a", "b"], [1, 2, 3])
-    >>> problem.addConstraint(lambda a, b: b > a, ["a", "b"])
+        @rtype: int
+        """
+        order, parent, children, unary, edges, checks = forest
+        values, supports = filtered
+        counts = {}
+        total = 1
+        for variable in reversed(order):
+            variablecounts = counts[variable] = {}
+            for index in values[variable]:
+                count = 1
+                for child in children[variable]:
+                    childcounts = counts[child]
+                    count *= sum([childcounts[x]
+                                  for x in supports[child][index]])
+                variablecounts[index] = count
+            if parent[variable] is None:
+                total *= sum(variablecounts.values())
+        return total
+
+    def prepareFallback(self):
+        """
+        Pass the settings of this solver on to the fallback solver
 
-    >>> solution = problem.getSolution()
-    >>> sorted(solution.items()) in result
-    True
+        @return: The fallback solver
+        @rtype: instance of a L{Solver} subclass
+        """
+        solver = self._fallback
+        solver.setLimits(self._timeout, self._maxnodes)
+        solver.setProgressCallback(self._callback, self._interval)
+        solver.setProfiling(self._profile)
+        self._cutset = None
+        self._delegated = True
+        return solver
 
-    >>> problem.getSolutions()
-    Traceback (most recent call last):
-       ...
-    NotImplementedError: MinConflictsSolver provides only a single solution
+    def getSolution(self, domains, constraints, vconstraints):
+        iter = self.getSolutionIter(domains, constraints, vconstraints)
+        try:
+            return iter.next()
+        except StopIteration:
+            return None
+        finally:
+            iter.close()
 
-    >>> problem.getSolutionIter()
-    Traceback (most recent call last):
-       ...
-    NotImplementedError: MinConflictsSolver doesn't provide iteration
-    """#"""
+    def getSolutions(self, domains, constraints, vconstraints):
+        return list(self.getSolutionIter(domains, constraints, vconstraints))
 
-    def __init__(self, steps=1000):
-        """
-        @param steps: Maximum number of steps to perform before giving up
-                      when looking for a solution (default is 1000)
-        @type  steps: int
+    def getSolutionIter(self, domains, constraints, vconstraints):
+        for assignments in self.getAssignmentIter(domains, constraints,
+                                                  vconstraints):
+            yield assignments.copy()
+
+    def getAssignmentIter(self, domains, constraints, vconstraints):
+        cutset = self.findCutset(domains, constraints)
+        if len(cutset) > self._maxcutset:
+            return self.prepareFallback().getAssignmentIter(domains,
+                                                            constraints,
+                                                            vconstraints)
+        self._cutset = cutset
+        self._delegated = False
+        return self.search(domains, vconstraints, cutset)
+
+    def search(self, domains, vconstraints, cutset):
         """
-        self._steps = steps
+        Yield the solutions found through the given cutset
 
-    def getSolution(self, domains, constraints, vconstraints):
-        assignments = {}
-        # Initial assignment
-        for variable in domains:
-            assignments[variable] = random.choice(domains[variable])
-        for _ in xrange(self._steps):
-            conflicted = False
-            lst = domains.keys()
-            random.shuffle(lst)
-            for variable in lst:
-                # Check if variable is not in conflict
-                for constraint, variables in vconstraints[variable]:
-                    if not constraint(variables, domains, assignments):
-                        break
-                else:
+        The same assignments dictionary is yielded every time.
+        """
+        stats, vconstraints = self.startStats(vconstraints)
+        try:
+            forest = self.getForest(domains, vconstraints, cutset)
+            for assignments in self.assignCutset(domains, cutset, forest[-1],
+                                                 {}, stats):
+                filtered = self.filterForest(domains, forest, assignments,
+                                             stats)
+                if filtered is None:
+                    stats.failures += 1
                     continue
-                # Variable has conflicts. Find values with less conflicts.
-                mincount = len(vconstraints[variable])
-                minvalues = []
-                for value in domains[variable]:
-                    assignments[variable] = value
-                    count = 0
-                    for constraint, variables in vconstraints[variable]:
-                        if not constraint(variables, domains, assignments):
-                            count += 1
-                    if count == mincount:
-                        minvalues.append(value)
-                    elif count < mincount:
-                        mincount = count
-                        del minvalues[:]
-                        minvalues.append(value)
-                # Pick a random one from these values.
-                assignments[variable] = random.choice(minvalues)
-                conflicted = True
-            if not conflicted:
-                return assignments
-        return None
+                for assignments in self.assignForest(domains, forest,
+                                                     filtered, assignments,
+                                                     stats):
+                    stats.solutions += 1
+                    yield assignments
+        except SearchLimitReached:
+            return
+        finally:
+            self.finishStats(stats)
+
+    def countSolutions(self, domains, constraints, vconstraints,
+                       limit=None, callback=None):
+        cutset = self.findCutset(domains, constraints)
+        if len(cutset) > self._maxcutset:
+            return self.prepareFallback().countSolutions(domains, constraints,
+                                                         vconstraints, limit,
+                                                         callback)
+        if callback is not None:
+            return Solver.countSolutions(self, domains, constraints,
+                                         vconstraints, limit, callback)
+        self._cutset = cutset
+        self._delegated = False
+        stats, vconstraints = self.startStats(vconstraints)
+        try:
+            forest = self.getForest(domains, vconstraints, cutset)
+            for assignments in self.assignCutset(domains, cutset, forest[-1],
+                                                 {}, stats):
+                filtered = self.filterForest(domains, forest, assignments,
+                                             stats)
+                if filtered is None:
+                    stats.failures += 1
+                    continue
+                stats.solutions += self.countForest(forest, filtered)
+                if limit is not None and stats.solutions >= limit:
+                    stats.solutions = limit
+                    break
+        except SearchLimitReached:
+            pass
+        finally:
+            self.finishStats(stats)
+        return stats.solutions
 
 # ----------------------------------------------------------------------
 # Variables
@@ -729,6 +4565,19 @@ class Variable(object):
         return self.name
 
 Unassigned = Variable("Unassigned")
+Unknown = Variable("Unknown")
+
+def undoTrail(trail, mark):
+    """
+    Restore the values hidden since the trail had the given length
+
+    @param trail: List of domains filled by L{Domain.hideValue}
+    @type  trail: list
+    @param mark: Length of the trail to go back to
+    @type  mark: int
+    """
+    while len(trail) > mark:
+        trail.pop().restoreValue()
 
 # ----------------------------------------------------------------------
 # Domains
@@ -747,17 +4596,244 @@ class Domain(list):
         @param set: Set of values that the given variables may assume
         @type  set: set of objects comparable by equality
         """
-        list.__init__(self, set)
-        self._hidden = []
-        self._states = []
+        list.__init__(self, set)
+        self._hidden = []
+        self._states = []
+        self._trail = None
+
+    def __copy__(self):
+        domain = list.__new__(self.__class__)
+        list.__init__(domain, self)
+        domain.__dict__.update(self.__dict__)
+        domain._hidden = self._hidden[:]
+        domain._states = self._states[:]
+        return domain
+
+    def resetState(self):
+        """
+        Reset to the original domain state, including all possible values
+        """
+        self.extend(self._hidden)
+        del self._hidden[:]
+        del self._states[:]
+
+    def pushState(self):
+        """
+        Save current domain state
+
+        Variables hidden after that call are restored when that state
+        is popped from the stack.
+        """
+        self._states.append(len(self))
+
+    def popState(self):
+        """
+        Restore domain state from the top of the stack
+
+        Variables hidden since the last popped state are then available
+        again.
+        """
+        diff = self._states.pop()-len(self)
+        if diff:
+            self.extend(self._hidden[-diff:])
+            del self._hidden[-diff:]
+
+    def hideValue(self, value):
+        """
+        Hide the given value from the domain
+
+        After that call the given value won't be seen as a possible value
+        on that domain anymore. The hidden value will be restored when the
+        previous saved state is popped.
+
+        @param value: Object currently available in the domain
+        """
+        list.remove(self, value)
+        self._hidden.append(value)
+        if self._trail is not None:
+            self._trail.append(self)
+
+    def hideValues(self, mask):
+        """
+        Hide several values from the domain at once
+
+        Hidden values are recorded as if L{hideValue} had been called for
+        each of them, in the domain order.
+
+        @param mask: Sequence of booleans, one per available value in the
+                     domain order, true for the values to be hidden
+        @type  mask: sequence
+        """
+        hidden = list(itertools.compress(self, mask))
+        if not hidden:
+            return
+        self[:] = [value for value, hide in itertools.izip(self, mask)
+                   if not hide]
+        self._hidden.extend(hidden)
+        if self._trail is not None:
+            self._trail.extend([self]*len(hidden))
+
+    def setTrail(self, trail):
+        """
+        Record hidden values in the given trail
+
+        While a trail is set, every call to L{hideValue} appends the domain
+        to it, so that L{undoTrail} may later restore hidden values in
+        the reverse order. States shouldn't be pushed or popped meanwhile.
+
+        @param trail: List shared by the domains of a problem, or None
+                      to stop recording
+        @type  trail: list
+        """
+        self._trail = trail
+
+    def restoreValue(self):
+        """
+        Restore the most recently hidden value
+
+        @return: Value restored
+        """
+        value = self._hidden.pop()
+        list.append(self, value)
+        return value
+
+class BitDomain(object):
+    """
+    Domain keeping its available values as a bitmask
+
+    Values are interned in a table when the domain is created, and bit
+    M{i} of an integer mask tells if the M{i}-th value of the table is
+    still available. Hiding and restoring values are O(1), and saved
+    states are just masks. It behaves as a read-only list of the available
+    values, so it may be used anywhere a L{Domain} is expected. Methods
+    changing the list in place, such as C{append} or C{sort}, and
+    concatenation with C{+} aren't available.
+
+    Every access to the values goes through Python code, so it's only
+    used when given explicitly to L{Problem.addVariable}. It pays off
+    when values are hidden and restored much more often than the domains
+    are iterated.
+
+    Example:
+
+    >>> domain = BitDomain([0, 1, 2])
+    >>> domain.pushState()
+    >>> domain.hideValue(1)
+    >>> domain, len(domain), 1 in domain
+    ([0, 2], 2, False)
+    >>> domain.hideValue(1)
+    Traceback (most recent call last):
+       ...
+    ValueError: BitDomain.hideValue(x): x not in domain
+    >>> domain.popState()
+    >>> domain == [0, 1, 2], domain.index(2), domain.count(3)
+    (True, 2, 0)
+    """
+
+    __hash__ = None
+
+    def __init__(self, set):
+        """
+        @param set: Set of values that the given variables may assume
+        @type  set: set of distinct hashable objects
+        """
+        values = tuple(set)
+        bits = {}
+        for index, value in enumerate(values):
+            bits[value] = 1 << index
+        if len(bits) != len(values):
+            raise ValueError, "Domain values must be distinct"
+        self._values = values
+        self._bits = bits
+        self._base = self._mask = (1 << len(values))-1
+        self._basesize = self._size = len(values)
+        self._states = []
+        self._hidden = []
+        self._trail = None
+        self._cache = {}
+
+    def __copy__(self):
+        domain = BitDomain.__new__(self.__class__)
+        domain.__dict__.update(self.__dict__)
+        domain._states = self._states[:]
+        domain._hidden = self._hidden[:]
+        domain._cache = {}
+        return domain
+
+    def _available(self):
+        mask = self._mask
+        if len(self._cache) > 256:
+            self._cache.clear()
+        available = tuple([value for index, value in enumerate(self._values)
+                           if mask >> index & 1])
+        self._cache[mask] = available
+        return available
+
+    def __len__(self):
+        return self._size
+
+    def __nonzero__(self):
+        return self._size != 0
+
+    def __iter__(self):
+        return iter(self._cache.get(self._mask) or self._available())
+
+    def __contains__(self, value):
+        try:
+            return bool(self._mask & self._bits[value])
+        except (KeyError, TypeError):
+            return False
+
+    def __getitem__(self, index):
+        available = self._cache.get(self._mask) or self._available()
+        if isinstance(index, slice):
+            return list(available[index])
+        return available[index]
+
+    def __eq__(self, other):
+        available = self._cache.get(self._mask) or self._available()
+        if isinstance(other, BitDomain):
+            other = other._cache.get(other._mask) or other._available()
+        try:
+            return list(available) == list(other)
+        except TypeError:
+            return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __repr__(self):
+        return repr(list(self._available()))
+
+    def index(self, value):
+        """
+        Return the position of the given value among the available ones
+
+        @param value: Object currently available in the domain
+        @raise ValueError: If the value isn't available
+        """
+        if value not in self:
+            raise ValueError, "BitDomain.index(x): x not in domain"
+        available = self._cache.get(self._mask) or self._available()
+        return available.index(value)
+
+    def count(self, value):
+        """
+        Return 1 if the given value is available, and 0 otherwise
+        """
+        return int(value in self)
 
     def resetState(self):
         """
         Reset to the original domain state, including all possible values
         """
-        self.extend(self._hidden)
-        del self._hidden[:]
+        self._mask = self._base
+        self._size = self._basesize
         del self._states[:]
+        del self._hidden[:]
 
     def pushState(self):
         """
@@ -766,7 +4842,7 @@ class Domain(list):
         Variables hidden after that call are restored when that state
         is popped from the stack.
         """
-        self._states.append(len(self))
+        self._states.append((self._mask, self._size))
 
     def popState(self):
         """
@@ -775,10 +4851,7 @@ class Domain(list):
         Variables hidden since the last popped state are then available
         again.
         """
-        diff = self._states.pop()-len(self)
-        if diff:
-            self.extend(self._hidden[-diff:])
-            del self._hidden[-diff:]
+        self._mask, self._size = self._states.pop()
 
     def hideValue(self, value):
         """
@@ -789,19 +4862,140 @@ class Domain(list):
         previous saved state is popped.
 
         @param value: Object currently available in the domain
+        @raise ValueError: If the value isn't available, as for L{Domain}
         """
-        list.remove(self, value)
-        self._hidden.append(value)
+        bit = self._bits.get(value, 0)
+        if not self._mask & bit:
+            raise ValueError, "BitDomain.hideValue(x): x not in domain"
+        self._mask &= ~bit
+        self._size -= 1
+        if self._trail is not None:
+            self._trail.append(self)
+            self._hidden.append(bit)
+
+    def hideValues(self, mask):
+        """
+        Hide several values from the domain at once
+
+        @see: L{Domain.hideValues}
+        """
+        bits = self._bits
+        available = self._cache.get(self._mask) or self._available()
+        hidden = [bits[value]
+                  for value in itertools.compress(available, mask)]
+        if not hidden:
+            return
+        removed = 0
+        for bit in hidden:
+            removed |= bit
+        self._mask &= ~removed
+        self._size -= len(hidden)
+        if self._trail is not None:
+            self._trail.extend([self]*len(hidden))
+            self._hidden.extend(hidden)
+
+    def setTrail(self, trail):
+        """
+        Record hidden values in the given trail
+
+        @see: L{Domain.setTrail}
+        """
+        self._trail = trail
+
+    def restoreValue(self):
+        """
+        Restore the most recently hidden value
+
+        @return: Value restored
+        """
+        bit = self._hidden.pop()
+        self._mask |= bit
+        self._size += 1
+        return self._values[bit.bit_length()-1]
+
+    def remove(self, value):
+        """
+        Permanently remove the given value from the domain
+
+        @param value: Object currently available in the domain
+        """
+        if value not in self:
+            raise ValueError, "BitDomain.remove(x): x not in domain"
+        bit = self._bits[value]
+        self._base &= ~bit
+        self._basesize -= 1
+        self._mask &= ~bit
+        self._size -= 1
 
 # ----------------------------------------------------------------------
 # Constraints
 # ----------------------------------------------------------------------
 
+def makeArray(values):
+    """
+    Build a one dimensional NumPy array holding the given values
+
+    Sequences among the values, such as tuples, are kept as objects
+    instead of becoming another dimension.
+
+    @param values: Values to be stored
+    @type  values: sequence
+    @rtype: C{numpy.ndarray}
+    """
+    result = numpy.array(values)
+    if result.ndim != 1:
+        result = numpy.empty(len(values), dtype=object)
+        for index, value in enumerate(values):
+            result[index] = value
+    return result
+
+def readsGlobals(code, globals):
+    """
+    Tell whether some code reads global variables
+
+    Builtins not shadowed by the given globals don't count, and the
+    code of nested functions is inspected as well.
+
+    @param code: Code to be inspected
+    @type  code: code object
+    @param globals: Globals of the function owning the code
+    @type  globals: dict
+    @rtype: bool
+    """
+    bytecode = map(ord, code.co_code)
+    index = 0
+    extended = 0
+    while index < len(bytecode):
+        op = bytecode[index]
+        if op < dis.HAVE_ARGUMENT:
+            index += 1
+            continue
+        arg = bytecode[index+1]+(bytecode[index+2] << 8)+extended
+        index += 3
+        extended = 0
+        if op == dis.EXTENDED_ARG:
+            extended = arg << 16
+        elif op in (dis.opmap["LOAD_GLOBAL"], dis.opmap["LOAD_NAME"]):
+            name = code.co_names[arg]
+            if name in globals or not hasattr(__builtin__, name):
+                return True
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType) and readsGlobals(const, globals):
+            return True
+    return False
+
 class Constraint(object):
     """
     Abstract base class for constraints
+
+    @cvar vectorized: Whether the constraint implements L{checkValues},
+                      so that generic forward checking and preprocessing
+                      check all candidate values of a variable in a
+                      single call when NumPy is available
     """
 
+    vectorized = False
+
     def __call__(self, variables, domains, assignments, forwardcheck=False):
         """
         Perform the constraint checking
@@ -853,12 +5047,58 @@ class Constraint(object):
         if len(variables) == 1:
             variable = variables[0]
             domain = domains[variable]
-            for value in domain[:]:
-                if not self(variables, domains, {variable: value}):
-                    domain.remove(value)
+            if self.vectorized and numpy is not None and domain:
+                values = domain[:]
+                accepted = self.checkValues(variables, {}, variable,
+                                            makeArray(values))
+                for value, accept in itertools.izip(values,
+                                                    accepted.tolist()):
+                    if not accept:
+                        domain.remove(value)
+            else:
+                for value in domain[:]:
+                    if not self(variables, domains, {variable: value}):
+                        domain.remove(value)
             constraints.remove((self, variables))
             vconstraints[variable].remove((self, variables))
 
+    def fingerprint(self):
+        """
+        Describe the constraint logic for L{SolutionCache} lookups
+
+        Two constraints with the same fingerprint must accept exactly the
+        same assignments. Constraints returning None, as this default
+        implementation does, keep problems using them out of the cache.
+
+        @return: Fingerprint of the constraint, or None
+        @rtype: string
+        """
+        return None
+
+    def checkValues(self, variables, assignments, variable, values):
+        """
+        Check many candidate values of a single unassigned variable
+
+        Constraints setting L{vectorized} implement it, so that the
+        values rejected are found and hidden in bulk, instead of calling
+        the constraint once per value.
+
+        @param variables: Variables affected by that constraint, in the
+                          same order provided by the user
+        @type  variables: sequence
+        @param assignments: Dictionary mapping assigned variables to their
+                            current assumed value. Every variable of the
+                            constraint but the given one is assigned.
+        @type  assignments: dict
+        @param variable: The unassigned variable
+        @param values: Candidate values of the unassigned variable
+        @type  values: C{numpy.ndarray}
+        @return: Boolean array telling which values are consistent
+        @rtype: C{numpy.ndarray}
+        """
+        raise NotImplementedError, \
+              "%s is not vectorized" % self.__class__.__name__
+
     def forwardCheck(self, variables, domains, assignments,
                      _unassigned=Unassigned):
         """
@@ -891,7 +5131,12 @@ class Constraint(object):
                 # Remove from the unassigned variable domain's all
                 # values which break our variable's constraints.
                 domain = domains[unassignedvariable]
-                if domain:
+                if domain and self.vectorized and numpy is not None:
+                    accepted = self.checkValues(variables, assignments,
+                                                unassignedvariable,
+                                                makeArray(domain[:]))
+                    domain.hideValues(numpy.logical_not(accepted).tolist())
+                elif domain:
                     for value in domain[:]:
                         assignments[unassignedvariable] = value
                         if not self(variables, domains, assignments):
@@ -922,18 +5167,157 @@ class FunctionConstraint(Constraint):
     >>> problem.addConstraint(FunctionConstraint(func), ["a", "b"])
     >>> problem.getSolution()
     {'a': 1, 'b': 2}
+
+    When the domains are small enough, the function is evaluated for
+    every combination of values while preprocessing, and checks become
+    table lookups. Tables may be disabled with a zero C{tablesize}:
+
+    >>> problem = Problem()
+    >>> problem.addVariables(["a", "b"], [1, 2])
+    >>> problem.addConstraint(FunctionConstraint(func, tablesize=0),
+    ...                       ["a", "b"])
+    >>> problem.getSolution()
+    {'a': 1, 'b': 2}
+
+    Tables are only used with the domains they were built for, so the
+    same constraint may be shared by models with other values:
+
+    >>> constraint = FunctionConstraint(func)
+    >>> problem = Problem()
+    >>> problem.addVariables(["a", "b"], range(4))
+    >>> problem.addConstraint(constraint, ["a", "b"])
+    >>> model = CompiledProblem(problem)
+    >>> other = Problem()
+    >>> other.addVariables(["a", "b"], [1, 2])
+    >>> other.addConstraint(constraint, ["a", "b"])
+    >>> model.countSolutions(), other.countSolutions()
+    (6, 1)
+
+    Functions written with NumPy operations may be vectorized. Forward
+    checking then calls them once with an array of all the candidate
+    values of the last unassigned variable, and expects an array of
+    booleans back:
+
+    >>> problem = Problem()
+    >>> problem.addVariables(["a", "b"], range(1000))
+    >>> problem.addConstraint(FunctionConstraint(lambda a, b: a+b == 1500,
+    ...                                          vectorized=True),
+    ...                       ["a", "b"])
+    >>> problem.addConstraint(lambda a: a > 900, ["a"])
+    >>> sorted(problem.getSolution().items())
+    [('a', 999), ('b', 501)]
     """#"""
 
-    def __init__(self, func, assigned=True):
+    def __init__(self, func, assigned=True, tablesize=256, key=None,
+                 vectorized=False):
         """
         @param func: Function wrapped and queried for constraint logic
         @type  func: callable object
         @param assigned: Whether the function may receive unassigned
                          variables or not
         @type  assigned: bool
+        @param tablesize: Maximum number of value combinations for which
+                          the function is compiled into a table when
+                          preprocessing (default is 256)
+        @type  tablesize: int
+        @param key: Fingerprint of the function logic. By default the
+                    fingerprint is derived from the code, default
+                    arguments and closure of plain functions, and
+                    functions reading globals other than builtins, bound
+                    methods and other callables have none.
+        @type  key: string
+        @param vectorized: Whether the function accepts a NumPy array in
+                           place of any one of its arguments, returning
+                           an array of booleans. It's still called with
+                           single values when checking assignments.
+                           Without NumPy installed the flag has no effect.
+        @type  vectorized: bool
         """
         self._func = func
         self._assigned = assigned
+        self._tablesize = tablesize
+        self._tables = {}
+        self._key = key
+        self.vectorized = vectorized
+
+    def fingerprint(self):
+        if self._key is not None:
+            return "FunctionConstraint(%r, %r)" % (self._key, self._assigned)
+        func = self._func
+        if not isinstance(func, types.FunctionType):
+            # Bound methods depend on their instance, and builtins or
+            # other callables have no code to describe.
+            return None
+        code = func.func_code
+        if readsGlobals(code, func.func_globals):
+            return None
+        try:
+            closure = [cell.cell_contents
+                       for cell in func.func_closure or ()]
+            digest = hashlib.sha1(marshal.dumps(code)).hexdigest()
+        except ValueError:
+            return None
+        return "FunctionConstraint(%s, %r, %r, %r)" % \
+               (digest, func.func_defaults, closure, self._assigned)
+
+    def preProcess(self, variables, domains, constraints, vconstraints):
+        Constraint.preProcess(self, variables, domains,
+                              constraints, vconstraints)
+        key = tuple(variables)
+        self._tables.pop(key, None)
+        if len(variables) < 2 or not self._assigned:
+            return
+        size = 1
+        for variable in variables:
+            size *= len(domains[variable])
+            if size > self._tablesize:
+                return
+        # Map every combination to the function result, and for each
+        # position, the other values in the combination to the set of
+        # values supported at that position.
+        lists = [domains[variable][:] for variable in variables]
+        for values in lists:
+            try:
+                map(hash, values)
+            except TypeError:
+                # Unhashable values.
+                return
+        func = self._func
+        truth = {}
+        supports = [{} for variable in variables]
+        for values in itertools.product(*lists):
+            result = truth[values] = func(*values)
+            if result:
+                for position, value in enumerate(values):
+                    supports[position].setdefault(
+                        values[:position]+values[position+1:], set()
+                        ).add(value)
+        # Keep the domains too, as the same constraint may be added to
+        # other problems with the same variables but other values.
+        self._tables[key] = (truth, supports,
+                             [domains[variable] for variable in variables])
+
+    def getTable(self, variables, domains):
+        """
+        Return the table built by L{preProcess} for the given domains
+
+        @return: Truth table and supports, or None if the table is
+                 missing or was built for other domains
+        @rtype: tuple
+        """
+        table = self._tables.get(tuple(variables))
+        if table is not None:
+            for variable, domain in itertools.izip(variables, table[2]):
+                if domains[variable] is not domain:
+                    return None
+        return table
+
+    def checkValues(self, variables, assignments, variable, values):
+        parms = [assignments.get(x, values) for x in variables]
+        accepted = numpy.asarray(self._func(*parms), dtype=bool)
+        if accepted.shape != values.shape:
+            accepted = numpy.broadcast_to(accepted, values.shape)
+        return accepted
 
     def __call__(self, variables, domains, assignments, forwardcheck=False,
                  _unassigned=Unassigned):
@@ -943,12 +5327,42 @@ class FunctionConstraint(Constraint):
             return ((self._assigned or self._func(*parms)) and
                     (not forwardcheck or missing != 1 or
                      self.forwardCheck(variables, domains, assignments)))
+        if self._tables:
+            table = self.getTable(variables, domains)
+            if table is not None:
+                result = table[0].get(tuple(parms), _unassigned)
+                if result is not _unassigned:
+                    return result
         return self._func(*parms)
 
+    def forwardCheck(self, variables, domains, assignments,
+                     _unassigned=Unassigned):
+        table = self.getTable(variables, domains)
+        if table is None:
+            return Constraint.forwardCheck(self, variables, domains,
+                                           assignments)
+        parms = [assignments.get(x, _unassigned) for x in variables]
+        if parms.count(_unassigned) != 1:
+            return True
+        position = parms.index(_unassigned)
+        del parms[position]
+        supported = table[1][position].get(tuple(parms), ())
+        domain = domains[variables[position]]
+        for value in domain[:]:
+            if value not in supported:
+                domain.hideValue(value)
+        return bool(domain)
+
 class AllDifferentConstraint(Constraint):
     """
     Constraint enforcing that values of all given variables are different
 
+    By default only values already assigned are removed from the other
+    domains. With matching enabled, a maximum matching between variables
+    and values is kept, and every value which can't take part in any
+    matching is removed (Regin's filtering). This detects pigeonhole
+    failures, such as three variables sharing two values, right away.
+
     Example:
 
     >>> problem = Problem()
@@ -956,8 +5370,31 @@ class AllDifferentConstraint(Constraint):
     >>> problem.addConstraint(AllDifferentConstraint())
     >>> sorted(sorted(x.items()) for x in problem.getSolutions())
     [[('a', 1), ('b', 2)], [('a', 2), ('b', 1)]]
+
+    >>> problem = Problem()
+    >>> problem.addVariables(["a", "b", "c"], [1, 2])
+    >>> problem.addVariable("d", range(10))
+    >>> problem.addConstraint(AllDifferentConstraint(matching=True),
+    ...                       ["a", "b", "c"])
+    >>> problem.getSolutions()
+    []
+    >>> problem.getSolver().getStats().nodes
+    2
     """#"""
 
+    def __init__(self, matching=False):
+        """
+        @param matching: Whether to filter domains with a bipartite matching
+                         between variables and values, instead of only
+                         removing assigned values (default false)
+        @type  matching: bool
+        """
+        self._matching = matching
+        self._matchings = {}
+
+    def fingerprint(self):
+        return "AllDifferentConstraint()"
+
     def __call__(self, variables, domains, assignments, forwardcheck=False,
                  _unassigned=Unassigned):
         seen = {}
@@ -967,6 +5404,9 @@ class AllDifferentConstraint(Constraint):
                 if value in seen:
                     return False
                 seen[value] = True
+        if self._matching and len(seen) < len(variables):
+            return self.filterValues(variables, domains, assignments,
+                                     forwardcheck)
         if forwardcheck:
             for variable in variables:
                 if variable not in assignments:
@@ -978,6 +5418,166 @@ class AllDifferentConstraint(Constraint):
                                 return False
         return True
 
+    def filterValues(self, variables, domains, assignments, forwardcheck):
+        """
+        Check and filter domains using a maximum matching
+
+        The matching found in the previous call for the same variables is
+        repaired, rather than built from scratch.
+
+        @return: False if no matching covers all variables, True otherwise
+        @rtype: bool
+        """
+        candidates = []
+        for variable in variables:
+            if variable in assignments:
+                candidates.append((assignments[variable],))
+            else:
+                candidates.append(tuple(domains[variable]))
+        key = tuple(variables)
+        matching = self._matchings.get(key)
+        owner = {}
+        if matching is None:
+            matching = [None]*len(variables)
+        else:
+            for index, value in enumerate(matching):
+                if value is not None and value not in owner and \
+                   value in candidates[index]:
+                    owner[value] = index
+                else:
+                    matching[index] = None
+        self._matchings[key] = matching
+        for index in xrange(len(variables)):
+            if matching[index] is None and \
+               not self.augment(index, candidates, matching, owner):
+                return False
+        if not forwardcheck:
+            return True
+
+        # Residual graph. Variables are nodes 0..n-1 and values follow.
+        # Matching edges go from variables to values, the others from
+        # values to variables.
+        size = len(variables)
+        nodes = {}
+        graph = [[] for index in xrange(size)]
+        for index, values in enumerate(candidates):
+            for value in values:
+                node = nodes.get(value)
+                if node is None:
+                    node = nodes[value] = len(graph)
+                    graph.append([])
+                if matching[index] == value:
+                    graph[index].append(node)
+                else:
+                    graph[node].append(index)
+
+        # Edges on alternating paths starting at free values are kept.
+        reached = [False]*len(graph)
+        stack = [node for value, node in nodes.iteritems()
+                 if value not in owner]
+        for node in stack:
+            reached[node] = True
+        while stack:
+            for successor in graph[stack.pop()]:
+                if not reached[successor]:
+                    reached[successor] = True
+                    stack.append(successor)
+
+        # And so are edges on alternating cycles.
+        component = self.findComponents(graph)
+
+        for index, variable in enumerate(variables):
+            if variable in assignments:
+                continue
+            domain = domains[variable]
+            for value in candidates[index]:
+                node = nodes[value]
+                if value != matching[index] and not reached[node] and \
+                   component[node] != component[index]:
+                    domain.hideValue(value)
+        return True
+
+    def augment(self, root, candidates, matching, owner):
+        """
+        Extend the matching to the given variable with an augmenting path
+
+        @return: False if the variable couldn't be matched, True otherwise
+        @rtype: bool
+        """
+        visited = set()
+        path = []
+        stack = [(root, iter(candidates[root]))]
+        while stack:
+            for value in stack[-1][1]:
+                if value in visited:
+                    continue
+                visited.add(value)
+                path.append(value)
+                index = owner.get(value)
+                if index is None:
+                    for (index, values), value in zip(stack, path):
+                        matching[index] = value
+                        owner[value] = index
+                    return True
+                stack.append((index, iter(candidates[index])))
+                break
+            else:
+                stack.pop()
+                if path:
+                    path.pop()
+        return False
+
+    def findComponents(self, graph):
+        """
+        Find the strongly connected components of a graph
+
+        Tarjan's algorithm, written without recursion so that large scopes
+        don't hit the recursion limit.
+
+        @param graph: Successors of each node, indexed by node
+        @type  graph: list of lists
+        @return: Component of each node, identified by its root node
+        @rtype: list
+        """
+        count = len(graph)
+        order = [None]*count
+        lowest = [0]*count
+        component = [None]*count
+        members = []
+        counter = 0
+        for start in xrange(count):
+            if order[start] is not None:
+                continue
+            order[start] = lowest[start] = counter
+            counter += 1
+            members.append(start)
+            work = [(start, iter(graph[start]))]
+            while work:
+                node, successors = work[-1]
+                for successor in successors:
+                    if order[successor] is None:
+                        order[successor] = lowest[successor] = counter
+                        counter += 1
+                        members.append(successor)
+                        work.append((successor, iter(graph[successor])))
+                        break
+                    elif component[successor] is None:
+                        if order[successor] < lowest[node]:
+                            lowest[node] = order[successor]
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        if lowest[node] < lowest[parent]:
+                            lowest[parent] = lowest[node]
+                    if lowest[node] == order[node]:
+                        while True:
+                            member = members.pop()
+                            component[member] = node
+                            if member == node:
+                                break
+        return component
+
 class AllEqualConstraint(Constraint):
     """
     Constraint enforcing that values of all given variables are equal
@@ -991,6 +5591,9 @@ class AllEqualConstraint(Constraint):
     [[('a', 1), ('b', 1)], [('a', 2), ('b', 2)]]
     """#"""
 
+    def fingerprint(self):
+        return "AllEqualConstraint()"
+
     def __call__(self, variables, domains, assignments, forwardcheck=False,
                  _unassigned=Unassigned):
         singlevalue = _unassigned
@@ -1011,6 +5614,85 @@ class AllEqualConstraint(Constraint):
                             domain.hideValue(value)
         return True
 
+def sumBounds(variables, multipliers, domains, assignments):
+    """
+    Compute the bounds of a (weighted) sum of variables
+
+    Assigned variables contribute their value, and unassigned ones the
+    smallest and largest values left in their domains.
+
+    @param multipliers: Factors applied to the variable values, or None
+    @type  multipliers: sequence of numbers
+    @return: Tuple (low, high, pending) with the bounds of the sum and a
+             list of (variable, multiplier, low, high) tuples with the
+             bounds of each unassigned variable contribution, or None if
+             some unassigned variable has an empty domain
+    @rtype: tuple
+    """
+    low = high = 0
+    pending = []
+    for index, variable in enumerate(variables):
+        if multipliers:
+            multiplier = multipliers[index]
+        else:
+            multiplier = 1
+        if variable in assignments:
+            value = assignments[variable]*multiplier
+            low += value
+            high += value
+        else:
+            domain = domains[variable]
+            if not domain:
+                return None
+            lowvalue = min(domain)*multiplier
+            highvalue = max(domain)*multiplier
+            if lowvalue > highvalue:
+                lowvalue, highvalue = highvalue, lowvalue
+            low += lowvalue
+            high += highvalue
+            pending.append((variable, multiplier, lowvalue, highvalue))
+    if type(low) is float:
+        low = round(low, 10)
+    if type(high) is float:
+        high = round(high, 10)
+    return low, high, pending
+
+def pruneSum(domains, pending, low, high, minimum, maximum):
+    """
+    Hide values which can't keep a sum within the given limits
+
+    @param pending: Unassigned variables as returned by L{sumBounds}
+    @type  pending: list
+    @param low: Lower bound of the sum, as returned by L{sumBounds}
+    @param high: Upper bound of the sum, as returned by L{sumBounds}
+    @param minimum: Smallest value allowed for the sum, or None
+    @param maximum: Largest value allowed for the sum, or None
+    @return: False if some domain was wiped out, True otherwise
+    @rtype: bool
+    """
+    for variable, multiplier, lowvalue, highvalue in pending:
+        domain = domains[variable]
+        otherlow = low-lowvalue
+        otherhigh = high-highvalue
+        for value in domain[:]:
+            contribution = value*multiplier
+            if maximum is not None:
+                total = otherlow+contribution
+                if type(total) is float:
+                    total = round(total, 10)
+                if total > maximum:
+                    domain.hideValue(value)
+                    continue
+            if minimum is not None:
+                total = otherhigh+contribution
+                if type(total) is float:
+                    total = round(total, 10)
+                if total < minimum:
+                    domain.hideValue(value)
+        if not domain:
+            return False
+    return True
+
 class MaxSumConstraint(Constraint):
     """
     Constraint enforcing that values of given variables sum up to
@@ -1036,6 +5718,10 @@ class MaxSumConstraint(Constraint):
         self._maxsum = maxsum
         self._multipliers = multipliers
 
+    def fingerprint(self):
+        return "MaxSumConstraint(%r, %r)" % \
+               (self._maxsum, self._multipliers and list(self._multipliers))
+
     def preProcess(self, variables, domains, constraints, vconstraints):
         Constraint.preProcess(self, variables, domains,
                               constraints, vconstraints)
@@ -1055,43 +5741,15 @@ class MaxSumConstraint(Constraint):
                         domain.remove(value)
 
     def __call__(self, variables, domains, assignments, forwardcheck=False):
-        multipliers = self._multipliers
         maxsum = self._maxsum
-        sum = 0
-        if multipliers:
-            for variable, multiplier in zip(variables, multipliers):
-                if variable in assignments:
-                    sum += assignments[variable]*multiplier
-            if type(sum) is float:
-                sum = round(sum, 10)
-            if sum > maxsum:
-                return False
-            if forwardcheck:
-                for variable, multiplier in zip(variables, multipliers):
-                    if variable not in assignments:
-                        domain = domains[variable]
-                        for value in domain[:]:
-                            if sum+value*multiplier > maxsum:
-                                domain.hideValue(value)
-                        if not domain:
-                            return False
-        else:
-            for variable in variables:
-                if variable in assignments:
-                    sum += assignments[variable]
-            if type(sum) is float:
-                sum = round(sum, 10)
-            if sum > maxsum:
-                return False
-            if forwardcheck:
-                for variable in variables:
-                    if variable not in assignments:
-                        domain = domains[variable]
-                        for value in domain[:]:
-                            if sum+value > maxsum:
-                                domain.hideValue(value)
-                        if not domain:
-                            return False
+        bounds = sumBounds(variables, self._multipliers, domains, assignments)
+        if bounds is None:
+            return False
+        low, high, pending = bounds
+        if low > maxsum:
+            return False
+        if forwardcheck and pending and high > maxsum:
+            return pruneSum(domains, pending, low, high, None, maxsum)
         return True
 
 class ExactSumConstraint(Constraint):
@@ -1119,6 +5777,10 @@ class ExactSumConstraint(Constraint):
         self._exactsum = exactsum
         self._multipliers = multipliers
 
+    def fingerprint(self):
+        return "ExactSumConstraint(%r, %r)" % \
+               (self._exactsum, self._multipliers and list(self._multipliers))
+
     def preProcess(self, variables, domains, constraints, vconstraints):
         Constraint.preProcess(self, variables, domains,
                               constraints, vconstraints)
@@ -1138,52 +5800,16 @@ class ExactSumConstraint(Constraint):
                         domain.remove(value)
 
     def __call__(self, variables, domains, assignments, forwardcheck=False):
-        multipliers = self._multipliers
         exactsum = self._exactsum
-        sum = 0
-        missing = False
-        if multipliers:
-            for variable, multiplier in zip(variables, multipliers):
-                if variable in assignments:
-                    sum += assignments[variable]*multiplier
-                else:
-                    missing = True
-            if type(sum) is float:
-                sum = round(sum, 10)
-            if sum > exactsum:
-                return False
-            if forwardcheck and missing:
-                for variable, multiplier in zip(variables, multipliers):
-                    if variable not in assignments:
-                        domain = domains[variable]
-                        for value in domain[:]:
-                            if sum+value*multiplier > exactsum:
-                                domain.hideValue(value)
-                        if not domain:
-                            return False
-        else:
-            for variable in variables:
-                if variable in assignments:
-                    sum += assignments[variable]
-                else:
-                    missing = True
-            if type(sum) is float:
-                sum = round(sum, 10)
-            if sum > exactsum:
-                return False
-            if forwardcheck and missing:
-                for variable in variables:
-                    if variable not in assignments:
-                        domain = domains[variable]
-                        for value in domain[:]:
-                            if sum+value > exactsum:
-                                domain.hideValue(value)
-                        if not domain:
-                            return False
-        if missing:
-            return sum <= exactsum
-        else:
-            return sum == exactsum
+        bounds = sumBounds(variables, self._multipliers, domains, assignments)
+        if bounds is None:
+            return False
+        low, high, pending = bounds
+        if low > exactsum or high < exactsum:
+            return False
+        if forwardcheck and pending and low != high:
+            return pruneSum(domains, pending, low, high, exactsum, exactsum)
+        return True
 
 class MinSumConstraint(Constraint):
     """
@@ -1210,23 +5836,21 @@ class MinSumConstraint(Constraint):
         self._minsum = minsum
         self._multipliers = multipliers
 
+    def fingerprint(self):
+        return "MinSumConstraint(%r, %r)" % \
+               (self._minsum, self._multipliers and list(self._multipliers))
+
     def __call__(self, variables, domains, assignments, forwardcheck=False):
-        for variable in variables:
-            if variable not in assignments:
-                return True
-        else:
-            multipliers = self._multipliers
-            minsum = self._minsum
-            sum = 0
-            if multipliers:
-                for variable, multiplier in zip(variables, multipliers):
-                    sum += assignments[variable]*multiplier
-            else:
-                for variable in variables:
-                    sum += assignments[variable]
-            if type(sum) is float:
-                sum = round(sum, 10)
-            return sum >= minsum
+        minsum = self._minsum
+        bounds = sumBounds(variables, self._multipliers, domains, assignments)
+        if bounds is None:
+            return False
+        low, high, pending = bounds
+        if high < minsum:
+            return False
+        if forwardcheck and pending and low < minsum:
+            return pruneSum(domains, pending, low, high, minsum, None)
+        return True
 
 class InSetConstraint(Constraint):
     """
@@ -1249,6 +5873,9 @@ class InSetConstraint(Constraint):
         """
         self._set = set
 
+    def fingerprint(self):
+        return "InSetConstraint(%r)" % sorted(map(repr, self._set))
+
     def __call__(self, variables, domains, assignments, forwardcheck=False):
         # preProcess() will remove it.
         raise RuntimeError, "Can't happen"
@@ -1284,6 +5911,9 @@ class NotInSetConstraint(Constraint):
         """
         self._set = set
 
+    def fingerprint(self):
+        return "NotInSetConstraint(%r)" % sorted(map(repr, self._set))
+
     def __call__(self, variables, domains, assignments, forwardcheck=False):
         # preProcess() will remove it.
         raise RuntimeError, "Can't happen"
@@ -1327,6 +5957,10 @@ class SomeInSetConstraint(Constraint):
         self._n = n
         self._exact = exact
 
+    def fingerprint(self):
+        return "SomeInSetConstraint(%r, %r, %r)" % \
+               (sorted(map(repr, self._set)), self._n, self._exact)
+
     def __call__(self, variables, domains, assignments, forwardcheck=False):
         set = self._set
         missing = 0
@@ -1392,6 +6026,10 @@ class SomeNotInSetConstraint(Constraint):
         self._n = n
         self._exact = exact
 
+    def fingerprint(self):
+        return "SomeNotInSetConstraint(%r, %r, %r)" % \
+               (sorted(map(repr, self._set)), self._n, self._exact)
+
     def __call__(self, variables, domains, assignments, forwardcheck=False):
         set = self._set
         missing = 0
@@ -1428,6 +6066,150 @@ class SomeNotInSetConstraint(Constraint):
                     return False
         return True
 
+class TableConstraint(Constraint):
+    """
+    Constraint enforcing that values of given variables match one of the
+    allowed tuples
+
+    For each position, the rows holding each value are kept as a bitset
+    in a Python integer. The rows still valid are found by intersecting
+    those bitsets for the current domains on every call. Then each value
+    not found in any valid row is hidden, on every unassigned variable in
+    scope.
+
+    Example:
+
+    >>> problem = Problem()
+    >>> problem.addVariables(["a", "b"], ["red", "green", "blue"])
+    >>> problem.addConstraint(TableConstraint([("red", "green"),
+    ...                                        ("green", "blue"),
+    ...                                        ("red", "yellow")]),
+    ...                       ["a", "b"])
+    >>> sorted(sorted(x.items()) for x in problem.getSolutions())
+    [[('a', 'green'), ('b', 'blue')], [('a', 'red'), ('b', 'green')]]
+    """#"""
+
+    def __init__(self, tuples):
+        """
+        @param tuples: Allowed combinations of values, in the same order
+                       as the constraint variables
+        @type  tuples: sequence of tuples
+        """
+        self._tuples = [tuple(row) for row in tuples]
+        self._masks = None
+
+    def fingerprint(self):
+        return "TableConstraint(%r)" % sorted(set(map(repr, self._tuples)))
+
+    def getMasks(self, size):
+        """
+        Obtain the bitsets of rows holding each value at each position
+
+        @param size: Number of variables in the constraint scope
+        @type  size: int
+        @return: One dictionary per position mapping values to bitsets
+        @rtype: list of dicts
+        """
+        masks = self._masks
+        if masks is None:
+            masks = [{} for position in xrange(size)]
+            for row, values in enumerate(self._tuples):
+                if len(values) != size:
+                    raise ValueError, "Tuple %r doesn't match the %d "\
+                                      "constrained variables" % (values, size)
+                bit = 1 << row
+                for position, value in enumerate(values):
+                    masks[position][value] = masks[position].get(value, 0)|bit
+            self._masks = masks
+        elif len(masks) != size:
+            raise ValueError, "Table constraint used with %d variables "\
+                              "instead of %d" % (size, len(masks))
+        return masks
+
+    def getRows(self, variables, domains, assignments, masks):
+        """
+        Compute the bitset of rows valid for the current domains
+
+        @return: Bitset of valid rows
+        @rtype: int
+        """
+        rows = (1 << len(self._tuples))-1
+        for position, variable in enumerate(variables):
+            mask = masks[position]
+            if variable in assignments:
+                rows &= mask.get(assignments[variable], 0)
+            else:
+                allowed = 0
+                for value in domains[variable]:
+                    allowed |= mask.get(value, 0)
+                rows &= allowed
+            if not rows:
+                break
+        return rows
+
+    def preProcess(self, variables, domains, constraints, vconstraints):
+        masks = self.getMasks(len(variables))
+        rows = self.getRows(variables, domains, {}, masks)
+        for position, variable in enumerate(variables):
+            mask = masks[position]
+            domain = domains[variable]
+            for value in domain[:]:
+                if not mask.get(value, 0) & rows:
+                    domain.remove(value)
+        if len(variables) == 1:
+            constraints.remove((self, variables))
+            vconstraints[variables[0]].remove((self, variables))
+
+    def __call__(self, variables, domains, assignments, forwardcheck=False):
+        masks = self.getMasks(len(variables))
+        rows = self.getRows(variables, domains, assignments, masks)
+        if not rows:
+            return False
+        if forwardcheck:
+            # Values without a valid row appear in no valid row, so
+            # hiding them leaves the valid rows unchanged, and a single
+            # pass reaches the fixpoint.
+            for position, variable in enumerate(variables):
+                if variable not in assignments:
+                    mask = masks[position]
+                    domain = domains[variable]
+                    for value in domain[:]:
+                        if not mask.get(value, 0) & rows:
+                            domain.hideValue(value)
+                    if not domain:
+                        return False
+        return True
+
+class ProfiledConstraint(Constraint):
+    """
+    Wrapper accounting the calls to a constraint in L{SolverStats}
+
+    @see: L{Solver.setProfiling}
+    """
+
+    def __init__(self, constraint, stats):
+        """
+        @param constraint: Wrapped constraint
+        @type  constraint: instance of a L{Constraint} subclass
+        @param stats: Statistics where calls are accounted
+        @type  stats: L{SolverStats}
+        """
+        self.constraint = constraint
+        self._stats = stats
+        self._name = constraint.__class__.__name__
+
+    def __call__(self, variables, domains, assignments, forwardcheck=False):
+        start = time.time()
+        try:
+            return self.constraint(variables, domains, assignments,
+                                   forwardcheck)
+        finally:
+            stats = self._stats
+            name = self._name
+            stats.calls[name] = stats.calls.get(name, 0)+1
+            stats.calltime[name] = (stats.calltime.get(name, 0.0)+
+                                    time.time()-start)
+
 if __name__ == "__main__":
     import doctest
     doctest.testmod()